@@ -10,19 +10,31 @@ import base64
 import logging
 import secrets  
 import json
-from datetime import datetime, timedelta
+import threading
+import time
+import gzip
+import re
+import hashlib
+import queue
+import atexit
+from datetime import date, datetime, timedelta
 from zoneinfo import ZoneInfo
 from contextlib import contextmanager
+from functools import lru_cache
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 
 # Third-party
-from flask import Flask, request, jsonify, make_response, abort, send_from_directory, render_template
+from flask import Flask, Response, request, jsonify, make_response, abort, send_from_directory, render_template, redirect, url_for
 from flask_cors import CORS
 import sqlite3
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from dotenv import load_dotenv
 from sendgrid import SendGridAPIClient
 from sendgrid.helpers.mail import Mail, Email, To, ReplyTo
-from urllib.parse import quote
+from urllib.parse import quote, urlencode
 # Load environment variables
 load_dotenv()
 
@@ -41,6 +53,8 @@ logger = logging.getLogger(__name__)
 # ============================================================================
 def log_metric(event_type, **kwargs):
     """Log structured metrics for easy parsing and analysis"""
+    if not logger.isEnabledFor(logging.INFO):
+        return
     parts = [f"{k}={v}" for k, v in kwargs.items()]
     logger.info(f"METRIC|{event_type}|{'|'.join(parts)}")
 
@@ -55,6 +69,10 @@ def now():
     """Get current time in Spanish timezone"""
     return datetime.now(TIMEZONE)
 
+def now_stamp():
+    """Current local time as 'YYYY-MM-DD HH:MM', comparable with fecha || ' ' || hora"""
+    return now().strftime('%Y-%m-%d %H:%M')
+
 # ============================================================================
 # FLASK APP INITIALIZATION
 # ============================================================================
@@ -62,6 +80,15 @@ def now():
 app = Flask(__name__)
 CORS(app)
 
+# jsonify responses: no indentation or spaces after separators, keys kept in
+# insertion order, UTF-8 text left as is rather than \u-escaped
+app.json.compact = True
+app.json.sort_keys = False
+app.json.ensure_ascii = False
+
+# Templates are compiled once per process; never re-stat them per request
+app.config['TEMPLATES_AUTO_RELOAD'] = False
+
 # ============================================================================
 # CONFIGURATION - All configurable values from environment variables
 # ============================================================================
@@ -70,186 +97,435 @@ CORS(app)
 SMS_ENABLED = os.getenv('SMS_ENABLED', 'false').lower() == 'true'
 MENSATEK_API_USER = os.getenv('MENSATEK_API_USER', '')
 MENSATEK_API_TOKEN = os.getenv('MENSATEK_API_TOKEN', '')
+SMS_MAX_PER_SECOND = float(os.getenv('SMS_MAX_PER_SECOND', '5'))  # 0 = unlimited
 
 # Email Configuration
 EMAIL_ENABLED = os.getenv('EMAIL_ENABLED', 'false').lower() == 'true'
 
 # Business Logic
 LARGE_GROUP_THRESHOLD = int(os.getenv('LARGE_GROUP_THRESHOLD', '4'))
+MAX_PERSONAS = int(os.getenv('MAX_PERSONAS', '50'))
+MAX_NOMBRE_LEN = 100
+MAX_TELEFONO_LEN = 20
 DOMAIN = os.getenv('DOMAIN', 'http://localhost:5000/')
 
 # Restaurant Info (for SMS messages)
 RESTAURANT_NAME = os.getenv('RESTAURANT_NAME', 'Les Monges')
 RESTAURANT_PHONE = os.getenv('RESTAURANT_PHONE', '965 78 57 31')
 
+# SMS message templates (rendered with str.format_map against a reservation row)
+SMS_CREATED_LARGE = (
+    "{nombre}, CONFIRMA AQUÍ (confirm here):\n"
+    "{confirmation_link}\n"
+    "{fecha_display} {hora} - {personas} pers.\n"
+    "Revisaremos disponibilidad.\n"
+    "Les Monges"
+)
+SMS_CREATED_SMALL = (
+    "{nombre}, confirma tu reserva (confirm):\n"
+    "{confirmation_link}\n"
+    "{fecha_display} {hora} - {personas} pers.\n"
+    "Les Monges"
+)
+SMS_CONFIRMED_LARGE = (
+    "Gracias {nombre}!\n"
+    "Solicitud para {personas} pers. recibida.\n"
+    "Te confirmaremos pronto.\n"
+    "Cancelar: mismo enlace (cancel: same link)"
+)
+SMS_CONFIRMED_SMALL = (
+    "¡Confirmado {nombre}!\n"
+    "{fecha_display} {hora}, {personas} pers.\n"
+    "¡Te esperamos!\n"
+    "Cancelar: mismo enlace (cancel: same link)"
+)
+SMS_CANCELLED = (
+    "{nombre}, reserva cancelada (reservation cancelled)\n"
+    "{fecha_display} {hora}, {personas} pers.\n"
+    "¡Esperamos verte pronto! Hope to see you soon!"
+)
+SMS_ADMIN_CANCELLED = (
+    "Lamentamos cancelar tu reserva (sorry, reservation cancelled), {nombre}.\n"
+    "{fecha_display} {hora}, {personas} pers.\n"
+    "Motivo: {reason}\n"
+    "Llámanos (call us): {restaurant_phone}"
+)
+SMS_APPROVED = (
+    "{nombre}, RESERVA APROBADA (approved by restaurant)\n"
+    "{fecha_display} {hora}, {personas} pers.\n"
+    "¡Te esperamos! See you then!\n"
+    "Cancelar: mismo enlace (cancel: same link)"
+)
+MANAGER_NEW_RESERVATION = (
+    "Nueva reserva {estado}: "
+    "{fecha_display} {hora}. "
+    "{personas} personas, {nombre}. "
+    "Tel: {telefono}"
+)
+MANAGER_CANCELLATION = (
+    "Cancelación: {nombre}, "
+    "{personas} personas, "
+    "{fecha_display} {hora}. "
+    "Tel: {telefono}"
+)
+
 # Database
 DB_PATH = os.getenv('DB_PATH', 'reservations.db')
 
 # Default hours (mutated by load_default_hours_from_file())
 DEFAULT_HOURS = ['13:00', '13:30', '14:00','14:30', '20:30', '21:00', '21:30','22:00']
+DEFAULT_HOURS_FILE = 'default_hours.json'
+_default_hours_mtime = None  # mtime of the file DEFAULT_HOURS was last read from
 
 # ============================================================================
 # DATABASE SETUP
 # ============================================================================
 
+# Bump whenever _SCHEMA_SQL changes so existing databases re-run it
+SCHEMA_VERSION = 2
+
+# Whole schema as one script, applied in a single transaction at startup
+_SCHEMA_SQL = '''
+    BEGIN;
+
+    -- Main reservations table
+    CREATE TABLE IF NOT EXISTS reservations (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        nombre TEXT NOT NULL,
+        telefono TEXT NOT NULL,
+        personas INTEGER NOT NULL,
+        fecha DATE NOT NULL,
+        hora TIME NOT NULL,
+        
+        -- Confirmation tracking (double verification)
+        user_confirmed BOOLEAN DEFAULT 0,
+        restaurant_confirmed BOOLEAN DEFAULT 0,
+        
+        -- Cancellation
+        cancelled BOOLEAN DEFAULT 0,
+        cancelled_at TIMESTAMP,
+        cancelled_by TEXT,
+        
+        -- SMS confirmation token
+        confirmation_token TEXT UNIQUE,
+        
+        -- Timestamps
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        
+        -- Optional notes
+        notes TEXT
+    );
+
+    -- Action log for Discord bot
+    CREATE TABLE IF NOT EXISTS action_log (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        reservation_id INTEGER NOT NULL,
+        action_type TEXT NOT NULL,
+        performed_by TEXT NOT NULL,
+        timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        details TEXT,
+        FOREIGN KEY (reservation_id) REFERENCES reservations(id)
+    );
+
+    -- Discord message tracking (for bot to update/delete messages)
+    CREATE TABLE IF NOT EXISTS discord_messages (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        reservation_id INTEGER NOT NULL,
+        channel_type TEXT NOT NULL,
+        message_id TEXT NOT NULL,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (reservation_id) REFERENCES reservations(id)
+    );
+
+    -- Blocked hours table
+    CREATE TABLE IF NOT EXISTS blocked_hours (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        fecha DATE NOT NULL,
+        hora TIME NOT NULL,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        UNIQUE(fecha, hora)
+    );
+
+    -- Contact messages table (for Discord bot to read and display)
+    CREATE TABLE IF NOT EXISTS contact_messages (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        nombre TEXT NOT NULL,
+        email TEXT NOT NULL,
+        mensaje TEXT NOT NULL,
+        read BOOLEAN DEFAULT 0,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    );
+
+    -- Create index for fast lookups
+    CREATE INDEX IF NOT EXISTS idx_blocked_hours_fecha ON blocked_hours(fecha);
+
+    -- Create indexes for performance
+    -- Duplicate-phone check on new reservations: partial, so it only holds
+    -- active confirmed rows, and covering (fecha, hora)
+    CREATE INDEX IF NOT EXISTS idx_res_active_phone ON reservations(telefono, fecha, hora) WHERE user_confirmed = 1 AND cancelled = 0;
+    -- Status flags + date: serves the calendar/status queries as a covering index
+    CREATE INDEX IF NOT EXISTS idx_res_status_fecha ON reservations(cancelled, user_confirmed, restaurant_confirmed, fecha);
+    -- Partial indexes: active reservations by date, cancelled history by cancel time
+    CREATE INDEX IF NOT EXISTS idx_res_active ON reservations(fecha, hora) WHERE cancelled = 0;
+    CREATE INDEX IF NOT EXISTS idx_res_cancelled ON reservations(cancelled_at) WHERE cancelled = 1;
+
+    -- Date + cancelled flag: most lookups filter on both
+    CREATE INDEX IF NOT EXISTS idx_fecha_cancelled ON reservations(fecha, cancelled);
+
+    -- Single-column indexes superseded by the composite ones above
+    DROP INDEX IF EXISTS idx_user_confirmed;
+    DROP INDEX IF EXISTS idx_restaurant_confirmed;
+    DROP INDEX IF EXISTS idx_cancelled;
+    DROP INDEX IF EXISTS idx_fecha;
+    -- Superseded by idx_res_active_phone / the UNIQUE(confirmation_token) autoindex
+    DROP INDEX IF EXISTS idx_reservations_dup_check;
+    DROP INDEX IF EXISTS idx_confirmation_token;
+
+    CREATE INDEX IF NOT EXISTS idx_action_log_timestamp ON action_log(timestamp);
+    CREATE INDEX IF NOT EXISTS idx_discord_messages_reservation ON discord_messages(reservation_id);
+
+    COMMIT;
+'''
+
 def init_database():
     """Initialize the database with all required tables"""
     conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    
-    # Main reservations table
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS reservations (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            nombre TEXT NOT NULL,
-            telefono TEXT NOT NULL,
-            personas INTEGER NOT NULL,
-            fecha DATE NOT NULL,
-            hora TIME NOT NULL,
-            
-            -- Confirmation tracking (double verification)
-            user_confirmed BOOLEAN DEFAULT 0,
-            restaurant_confirmed BOOLEAN DEFAULT 0,
-            
-            -- Cancellation
-            cancelled BOOLEAN DEFAULT 0,
-            cancelled_at TIMESTAMP,
-            cancelled_by TEXT,
-            
-            -- SMS confirmation token
-            confirmation_token TEXT UNIQUE,
-            
-            -- Timestamps
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            
-            -- Optional notes
-            notes TEXT
-        )
-    ''')
-    
-    # Action log for Discord bot
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS action_log (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            reservation_id INTEGER NOT NULL,
-            action_type TEXT NOT NULL,
-            performed_by TEXT NOT NULL,
-            timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            details TEXT,
-            FOREIGN KEY (reservation_id) REFERENCES reservations(id)
-        )
-    ''')
-    
-    # Discord message tracking (for bot to update/delete messages)
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS discord_messages (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            reservation_id INTEGER NOT NULL,
-            channel_type TEXT NOT NULL,
-            message_id TEXT NOT NULL,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (reservation_id) REFERENCES reservations(id)
-        )
-    ''')
-
-    # Blocked hours table
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS blocked_hours (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            fecha DATE NOT NULL,
-            hora TIME NOT NULL,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            UNIQUE(fecha, hora)
-        )
-    ''')
-
-    # Contact messages table (for Discord bot to read and display)
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS contact_messages (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            nombre TEXT NOT NULL,
-            email TEXT NOT NULL,
-            mensaje TEXT NOT NULL,
-            read BOOLEAN DEFAULT 0,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    ''')
-    
-    # Create index for fast lookups
-    cursor.execute('CREATE INDEX IF NOT EXISTS idx_blocked_hours_fecha ON blocked_hours(fecha)')
-    
-    # Create indexes for performance
-    cursor.execute('CREATE INDEX IF NOT EXISTS idx_confirmation_token ON reservations(confirmation_token)')
-    cursor.execute('CREATE INDEX IF NOT EXISTS idx_user_confirmed ON reservations(user_confirmed)')
-    cursor.execute('CREATE INDEX IF NOT EXISTS idx_restaurant_confirmed ON reservations(restaurant_confirmed)')
-    cursor.execute('CREATE INDEX IF NOT EXISTS idx_cancelled ON reservations(cancelled)')
-    cursor.execute('CREATE INDEX IF NOT EXISTS idx_fecha ON reservations(fecha)')
-    cursor.execute('CREATE INDEX IF NOT EXISTS idx_action_log_timestamp ON action_log(timestamp)')
-    cursor.execute('CREATE INDEX IF NOT EXISTS idx_discord_messages_reservation ON discord_messages(reservation_id)')
-    
-    conn.commit()
+    # WAL is persistent in the file: set it (and the rest) before creating tables
+    conn.executescript(_DB_PRAGMAS)
+    if conn.execute('PRAGMA user_version').fetchone()[0] >= SCHEMA_VERSION:
+        conn.close()
+        logger.info("Database schema up to date")
+        return
+    conn.executescript(_SCHEMA_SQL)
+    conn.execute(f'PRAGMA user_version = {SCHEMA_VERSION}')
     conn.close()
     logger.info("Database initialized successfully")
 
+_TLS = threading.local()
+
+# One writer connection per process, used only while holding _WRITE_LOCK:
+# writers queue on the lock instead of spinning in SQLite's busy handler.
+# Reads go through per-thread read-only connections and never take it.
+_WRITE_LOCK = threading.Lock()
+_writer_conn = None
+
+# Per-connection prepared statement cache (keyed by SQL text); sized so the
+# admin filter combinations don't evict the hot request statements
+DB_CACHED_STATEMENTS = 256
+
+# Applied once to every pooled connection
+_DB_PRAGMAS = (
+    "PRAGMA journal_mode=WAL;"
+    "PRAGMA synchronous=NORMAL;"
+    "PRAGMA busy_timeout=5000;"
+    "PRAGMA temp_store=MEMORY;"
+    "PRAGMA mmap_size=268435456;"
+    "PRAGMA cache_size=-20000;"
+)
+
+def get_conn():
+    """The process-wide writer connection (caller must hold _WRITE_LOCK)"""
+    global _writer_conn
+    if _writer_conn is None:
+        conn = sqlite3.connect(DB_PATH, check_same_thread=False, isolation_level=None,
+                               cached_statements=DB_CACHED_STATEMENTS)
+        conn.row_factory = sqlite3.Row
+        conn.executescript(_DB_PRAGMAS)
+        _writer_conn = conn
+    return _writer_conn
+
 @contextmanager
 def get_db():
-    """Database connection context manager"""
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
-    try:
-        yield conn
-    finally:
-        conn.close()
+    """Read-only database connection context manager (per-thread, autocommit)"""
+    yield get_read_conn()
+
+@contextmanager
+def db_transaction():
+    """Write transaction on the writer connection (BEGIN IMMEDIATE ... COMMIT)"""
+    if getattr(_TLS, 'writing', False):
+        # Nested write (e.g. log_action inside a handler's transaction): join it
+        yield get_conn()
+        return
+    with _WRITE_LOCK:
+        conn = get_conn()
+        conn.execute('BEGIN IMMEDIATE')
+        _TLS.writing = True
+        try:
+            yield conn
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+        finally:
+            _TLS.writing = False
+
+def get_read_conn():
+    """Per-thread read-only connection for lookups that never write"""
+    conn = getattr(_TLS, 'read_conn', None)
+    if conn is None:
+        conn = sqlite3.connect(DB_PATH, check_same_thread=False, isolation_level=None,
+                               cached_statements=DB_CACHED_STATEMENTS)
+        conn.row_factory = sqlite3.Row
+        conn.execute('PRAGMA busy_timeout=5000')
+        conn.execute('PRAGMA query_only=1')
+        _TLS.read_conn = conn
+    return conn
 
 # ============================================================================
 # HELPER FUNCTIONS
 # ============================================================================
 
+class TTLCache:
+    """Small thread-safe LRU cache whose entries expire after `ttl` seconds"""
+
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return default
+            expires, value = item
+            if expires < time.monotonic():
+                del self._data[key]
+                return default
+            return value
+
+    def __setitem__(self, key, value):
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key, default=None):
+        with self._lock:
+            item = self._data.pop(key, None)
+        return default if item is None else item[1]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+STREAM_CHUNK_ROWS = 200
+
+def stream_json_rows(cursor, key):
+    """Stream {"success": true, key: [rows...]} without building the full list"""
+    columns = [d[0] for d in cursor.description]
+    def encode(rows):
+        # app.json.compact only applies to jsonify; dumps needs the separators
+        return ','.join(app.json.dumps(dict(zip(columns, row)), separators=(',', ':')) for row in rows)
+    
+    # First chunk is read before the 200 goes out: errors there still reach the
+    # caller, and small result sets are sent as one buffered body
+    first = cursor.fetchmany(STREAM_CHUNK_ROWS)
+    if len(first) < STREAM_CHUNK_ROWS:
+        return Response(f'{{"success":true,"{key}":[{encode(first)}]}}', mimetype='application/json')
+    
+    def generate():
+        yield f'{{"success":true,"{key}":[' + encode(first)
+        try:
+            while True:
+                rows = cursor.fetchmany(STREAM_CHUNK_ROWS)
+                if not rows:
+                    break
+                yield ',' + encode(rows)
+        except Exception:
+            # Headers are already sent: the body ends truncated (invalid JSON)
+            logger.exception("Error streaming %s rows", key)
+            return
+        yield ']}'
+    return Response(generate(), mimetype='application/json')
+
+# admin_calendar payloads by (year, month); absorbs dashboard polling
+_CALENDAR_CACHE = TTLCache(maxsize=64, ttl=5)
+
+def invalidate_calendar_cache():
+    """Drop cached calendar payloads after reservation counts change"""
+    _CALENDAR_CACHE.clear()
+
+MENSATEK_SMS_URL = "https://api.mensatek.com/v7/EnviarSMS"
+
+# MensaTek credentials are fixed for the process: build the headers once
+_SMS_HEADERS = {
+    'Authorization': 'Basic ' + base64.b64encode(
+        f"{MENSATEK_API_USER}:{MENSATEK_API_TOKEN}".encode()
+    ).decode(),
+    'Content-Type': 'application/x-www-form-urlencoded'
+}
+
+# SMS sends that don't affect the response run here, off the request path
+SMS_WORKERS = 4
+_SMS_POOL = ThreadPoolExecutor(max_workers=SMS_WORKERS, thread_name_prefix='sms')
+
+# One keep-alive session for outbound HTTP (MensaTek, Discord webhook), with
+# a connection per SMS worker. Only failed connects are retried: re-sending a
+# POST that reached the provider could deliver the SMS twice.
+_HTTP = requests.Session()
+_HTTP.mount('https://', HTTPAdapter(
+    pool_connections=4,
+    pool_maxsize=SMS_WORKERS * 2,
+    max_retries=Retry(total=2, connect=2, read=0, status=0, backoff_factor=0.2),
+))
+
+# Outgoing SMS are spaced to stay under the provider's rate limit
+_SMS_RATE_LOCK = threading.Lock()
+_sms_next_slot = 0.0
+
+def _wait_for_sms_slot():
+    """Block until this process may send its next SMS"""
+    global _sms_next_slot
+    if SMS_MAX_PER_SECOND <= 0:
+        return
+    with _SMS_RATE_LOCK:
+        current = time.monotonic()
+        slot = max(current, _sms_next_slot)
+        _sms_next_slot = slot + 1 / SMS_MAX_PER_SECOND
+    if slot > current:
+        time.sleep(slot - current)
+
+def _build_sms_payload(phone, message):
+    """Form-encoded MensaTek request body, built once per SMS (retries reuse it)"""
+    return urlencode({
+        'Remitente': RESTAURANT_NAME,
+        'Destinatarios': json.dumps([{'Movil': phone}], separators=(',', ':')),
+        'Mensaje': message,
+        'Resp': 'JSON'
+    })
+
 def send_sms(phone, message):
     """Send SMS via MensaTek API v7"""
     if not SMS_ENABLED:
-        logger.info(f"📱 SMS SIMULATION to {phone}:")
-        logger.info(f"   Message: {message}")
+        logger.info("📱 SMS SIMULATION to %s:", phone)
+        logger.info("   Message: %s", message)
         return True
     
     if not MENSATEK_API_USER or not MENSATEK_API_TOKEN:
         logger.error("SMS credentials not configured!")
         return False
     
+    _wait_for_sms_slot()
     try:
-        url = "https://api.mensatek.com/v7/EnviarSMS"
-        
-        # Create basic auth header
-        auth_string = f"{MENSATEK_API_USER}:{MENSATEK_API_TOKEN}"
-        auth_encoded = base64.b64encode(auth_string.encode()).decode()
-        
-        headers = {
-            'Authorization': f'Basic {auth_encoded}',
-            'Content-Type': 'application/x-www-form-urlencoded'
-        }
-        
         # Clean phone number
-        clean_phone = phone.replace(' ', '').replace('-', '')
-        logger.debug(f"Sending SMS to: {clean_phone}")
-        
-        data = {
-            'Remitente': RESTAURANT_NAME,
-            'Destinatarios': f'[{{"Movil":"{clean_phone}"}}]',
-            'Mensaje': message,
-            'Resp': 'JSON'
-        }
+        clean_phone = phone.translate(_PHONE_STRIP)
+        logger.debug("Sending SMS to: %s", clean_phone)
         
-        response = requests.post(url, data=data, headers=headers, timeout=10)
+        payload = _build_sms_payload(clean_phone, message)
+        response = _HTTP.post(MENSATEK_SMS_URL, data=payload, headers=_SMS_HEADERS, timeout=10)
         
         if response.status_code == 200:
-            logger.info(f"MENSATEK RESPONSE: {response.text}")
+            logger.info("MENSATEK RESPONSE: %s", response.text)
             result = response.json()
             if isinstance(result, list):
                 result = result[0] if result else {}
             
             if result.get('Res') == 1:
 
-                logger.info(f"✅ SMS sent successfully to {phone}")
+                logger.info("✅ SMS sent successfully to %s", phone)
                 return True
             else:
                 logger.error(f"SMS failed: {result}")
@@ -262,6 +538,25 @@ def send_sms(phone, message):
         logger.error(f"SMS exception: {str(e)}")
         return False
 
+def _send_sms_job(phone, message, reservation_id):
+    """Pool task: send, and record failures in the action log for the Discord bot"""
+    try:
+        if not send_sms(phone, message) and reservation_id is not None:
+            logger.warning("SMS failed for reservation %s", reservation_id)
+            log_action(reservation_id, 'sms_failed', 'system', f'SMS a {phone} no enviado')
+    except Exception:
+        logger.exception("Error in background SMS to %s", phone)
+
+def send_sms_async(phone, message, reservation_id=None):
+    """Queue an SMS on the background pool; True if it was queued (not sent)"""
+    try:
+        _SMS_POOL.submit(_send_sms_job, phone, message, reservation_id)
+    except RuntimeError:
+        # Pool already shut down (process exiting)
+        logger.error("SMS pool unavailable, SMS to %s not queued", phone)
+        return False
+    return True
+
 def send_discord_contact_notification(nombre, email, mensaje):
     """Send contact form notification to Discord webhook"""
     if not DISCORD_CONTACT_WEBHOOK_URL:
@@ -297,10 +592,10 @@ def send_discord_contact_notification(nombre, email, mensaje):
             "embeds": [embed]
         }
 
-        response = requests.post(DISCORD_CONTACT_WEBHOOK_URL, json=payload, timeout=10)
+        response = _HTTP.post(DISCORD_CONTACT_WEBHOOK_URL, json=payload, timeout=10)
 
         if response.status_code in [200, 204]:
-            logger.info(f"✅ Discord notification sent for contact from {nombre}")
+            logger.info("✅ Discord notification sent for contact from %s", nombre)
             return True
         else:
             logger.error(f"Discord webhook failed with status {response.status_code}: {response.text}")
@@ -312,47 +607,73 @@ def send_discord_contact_notification(nombre, email, mensaje):
 
 def save_default_hours_to_file():
     """Save DEFAULT_HOURS to a JSON file"""
+    global _default_hours_mtime
     try:
-        with open('default_hours.json', 'w') as f:
+        with open(DEFAULT_HOURS_FILE, 'w') as f:
             json.dump(DEFAULT_HOURS, f)
+        _default_hours_mtime = os.stat(DEFAULT_HOURS_FILE).st_mtime_ns
         logger.info("Default hours saved to file")
     except Exception as e:
         logger.error(f"Error saving default hours to file: {str(e)}")
 
 def load_default_hours_from_file():
-    """Load DEFAULT_HOURS from JSON file if it exists"""
-    global DEFAULT_HOURS
+    """Load DEFAULT_HOURS from JSON file if it changed since the last read"""
+    global DEFAULT_HOURS, _default_hours_mtime
     try:
-        with open('default_hours.json', 'r') as f:
+        mtime = os.stat(DEFAULT_HOURS_FILE).st_mtime_ns
+        if mtime == _default_hours_mtime:
+            return
+        with open(DEFAULT_HOURS_FILE, 'r') as f:
             DEFAULT_HOURS = json.load(f)
-        logger.info(f"Default hours loaded from file: {DEFAULT_HOURS}")
+        _default_hours_mtime = mtime
+        logger.info("Default hours loaded from file: %s", DEFAULT_HOURS)
     except FileNotFoundError:
-        logger.info("No default_hours.json found, using hardcoded defaults")
+        if _default_hours_mtime is None:
+            logger.info("No default_hours.json found, using hardcoded defaults")
+            _default_hours_mtime = -1
     except Exception as e:
         logger.error(f"Error loading default hours from file: {str(e)}")
+
 def is_large_group(personas):
-    """Check if reservation requires manual confirmation"""
-    return int(personas) > LARGE_GROUP_THRESHOLD
+    """Check if reservation requires manual confirmation (personas is an int)"""
+    return personas > LARGE_GROUP_THRESHOLD
+
+# Shape checks for form input, run before any DB work
+_DATE_RE = re.compile(r'\d{4}-\d{2}-\d{2}').fullmatch
+_TIME_RE = re.compile(r'(?:[01]\d|2[0-3]):[0-5]\d').fullmatch
+
+def is_valid_fecha(fecha_str):
+    """YYYY-MM-DD that is also a real calendar date"""
+    if not _DATE_RE(fecha_str):
+        return False
+    try:
+        date.fromisoformat(fecha_str)
+    except ValueError:
+        return False
+    return True
+
+# Separators dropped from phone numbers, removed in a single pass
+_PHONE_STRIP = str.maketrans('', '', ' -()')
 
 def clean_phone_number(phone):
     """Standardize phone number format"""
-    clean = phone.replace(' ', '').replace('-', '').replace('(', '').replace(')', '')
+    clean = phone.translate(_PHONE_STRIP)
     if not clean.startswith('+'):
         clean = '+' + clean
     return clean
 
+@lru_cache(maxsize=512)
 def format_date_spanish(fecha_str):
     """Convert YYYY-MM-DD to DD/MM/YYYY"""
-    fecha_obj = datetime.strptime(fecha_str, '%Y-%m-%d')
-    return fecha_obj.strftime('%d/%m/%Y')
+    y, m, d = fecha_str.split('-')
+    return f'{d}/{m}/{y}'
 
-def get_current_timeslot():
+def get_current_timeslot(current=None):
     """
     Determine current timeslot for booking restrictions
     Returns: 'before_morning', 'morning', or 'evening'
     """
-    current = now()
-    hour = current.hour
+    hour = (current or now()).hour
     
     if hour < 12:
         return 'before_morning'
@@ -361,26 +682,29 @@ def get_current_timeslot():
     else:
         return 'evening'
 
-def is_booking_allowed(fecha_str, hora_str):
+def is_booking_allowed(fecha_str, hora_str, current=None, conn=None):
     """
     Check if booking is allowed based on opening times and blocked hours
     Morning service: 12:00 PM
     Evening service: 19:00 (7 PM)
     
+    Pass `current` to reuse a timestamp the caller already sampled, and the
+    caller's write-transaction `conn` so the blocked-hour check sees its state.
+    
     Returns: (allowed: bool, reason: str)
     """
     try:
-        fecha = datetime.strptime(fecha_str, '%Y-%m-%d').date()
-        hora = datetime.strptime(hora_str, '%H:%M').time()
-        current = now()
+        fecha = date.fromisoformat(fecha_str)
+        hour = int(hora_str[:2])
+        current = current or now()
         today = current.date()
         
         # Check if hour is blocked
-        if not is_hour_available(fecha_str, hora_str):
+        if not is_hour_available(fecha_str, hora_str, conn):
             return False, "Esta hora no está disponible"
         
         # Determine if booking is for morning or evening
-        booking_timeslot = 'morning' if hora.hour < 19 else 'evening'
+        booking_timeslot = 'morning' if hour < 19 else 'evening'
         
         # Past date check
         if fecha < today:
@@ -388,7 +712,7 @@ def is_booking_allowed(fecha_str, hora_str):
         
         # Today's bookings
         if fecha == today:
-            current_time = get_current_timeslot()
+            current_time = get_current_timeslot(current)
             
             if current_time == 'before_morning':
                 return True, ""
@@ -408,18 +732,102 @@ def is_booking_allowed(fecha_str, hora_str):
         return False, f"Error al validar fecha/hora: {str(e)}"
 
 
-def log_action(reservation_id, action_type, performed_by, details=None):
-    """Log action to database (for Discord bot to read)"""
-    with get_db() as conn:
-        cursor = conn.cursor()
-        cursor.execute('''
-            INSERT INTO action_log (reservation_id, action_type, performed_by, details)
-            VALUES (?, ?, ?, ?)
-        ''', (reservation_id, action_type, performed_by, details))
-        conn.commit()
+_ACTION_LOG_SQL = '''
+    INSERT INTO action_log (reservation_id, action_type, performed_by, details, timestamp)
+    VALUES (?, ?, ?, ?, ?)
+'''
+
+# Standalone action log entries are batched by a background writer
+ACTION_LOG_FLUSH_INTERVAL = 0.1  # seconds
+ACTION_LOG_MAX_BATCH = 500
+_ACTION_LOG_QUEUE = queue.SimpleQueue()
+
+def log_action(reservation_id, action_type, performed_by, details=None, conn=None):
+    """Log action to database (for Discord bot to read)
+    
+    Pass the caller's `conn` to write the entry in its open transaction;
+    otherwise the entry is queued for the background batch writer.
+    """
+    # Stamped now (UTC, CURRENT_TIMESTAMP format) so a batched row keeps the
+    # time of the action rather than the time of the flush
+    stamp = time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime())
+    row = (reservation_id, action_type, performed_by, details, stamp)
+    if conn is None:
+        _ACTION_LOG_QUEUE.put(row)
+    else:
+        conn.execute(_ACTION_LOG_SQL, row)
+
+def _write_action_log(rows):
+    """Write a batch of queued action log entries in one transaction"""
+    try:
+        with db_transaction() as conn:
+            conn.executemany(_ACTION_LOG_SQL, rows)
+    except sqlite3.IntegrityError:
+        # One bad entry must not drop the whole batch: retry row by row
+        for row in rows:
+            try:
+                with db_transaction() as conn:
+                    conn.execute(_ACTION_LOG_SQL, row)
+            except Exception:
+                logger.exception("Error writing action log entry %s", row)
+    except Exception:
+        logger.exception("Error writing %s action log entries", len(rows))
+
+def _action_log_worker():
+    """Background loop that writes queued action log entries in batches
+    
+    A None in the queue stops it after writing the batch in progress.
+    """
+    while True:
+        row = _ACTION_LOG_QUEUE.get()
+        if row is None:
+            return
+        rows = [row]
+        stop = False
+        deadline = time.monotonic() + ACTION_LOG_FLUSH_INTERVAL
+        while len(rows) < ACTION_LOG_MAX_BATCH:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                row = _ACTION_LOG_QUEUE.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if row is None:
+                stop = True
+                break
+            rows.append(row)
+        _write_action_log(rows)
+        if stop:
+            return
+
+_action_log_thread = threading.Thread(target=_action_log_worker, daemon=True)
+
+def _drain_action_log():
+    """Stop the batch writer, then write whatever is still queued (run at exit)"""
+    _ACTION_LOG_QUEUE.put(None)
+    _action_log_thread.join(timeout=5)
+    rows = []
+    while True:
+        try:
+            row = _ACTION_LOG_QUEUE.get_nowait()
+        except queue.Empty:
+            break
+        if row is not None:
+            rows.append(row)
+    if rows:
+        _write_action_log(rows)
+
+# Blocked hours by fecha, for display only (available-hours API, admin panel).
+# Admin block/unblock in this worker evicts the date; the short TTL bounds how
+# long other workers can show a stale list. Booking decisions never use it.
+_BLOCKED_HOURS_CACHE = TTLCache(maxsize=256, ttl=10)
 
 def get_blocked_hours_for_date(fecha_str):
     """Get list of blocked hours for a specific date"""
+    blocked = _BLOCKED_HOURS_CACHE.get(fecha_str)
+    if blocked is not None:
+        return blocked
     with get_db() as conn:
         cursor = conn.cursor()
         cursor.execute('''
@@ -427,7 +835,9 @@ def get_blocked_hours_for_date(fecha_str):
             WHERE fecha = ?
             ORDER BY hora
         ''', (fecha_str,))
-        return [row['hora'] for row in cursor.fetchall()]
+        blocked = tuple(row['hora'] for row in cursor.fetchall())
+    _BLOCKED_HOURS_CACHE[fecha_str] = blocked
+    return blocked
 
 
 def get_available_hours_for_date(fecha_str):
@@ -437,10 +847,13 @@ def get_available_hours_for_date(fecha_str):
     return sorted(list(available))
 
 
-def is_hour_available(fecha_str, hora_str):
-    """Check if a specific hour is available for booking"""
-    blocked = get_blocked_hours_for_date(fecha_str)
-    return hora_str not in blocked
+def is_hour_available(fecha_str, hora_str, conn=None):
+    """Check if a specific hour is available for booking (live, uncached)"""
+    conn = conn or get_read_conn()
+    return conn.execute(
+        'SELECT 1 FROM blocked_hours WHERE fecha = ? AND hora = ?',
+        (fecha_str, hora_str)
+    ).fetchone() is None
 
 def notify_managers(message):
     """Send SMS to manager phone numbers for new reservations/cancellations"""
@@ -453,7 +866,36 @@ def notify_managers(message):
     
     for phone in manager_phones:
         send_sms(phone, message)
-        logger.info(f"Manager notification sent to {phone}")
+        logger.info("Manager notification sent to %s", phone)
+
+# Manager notifications are coalesced and flushed once per window, at most
+# MANAGER_NOTIFY_MAX_BATCH per SMS so a burst doesn't build an oversized text
+MANAGER_NOTIFY_INTERVAL = 2  # seconds
+MANAGER_NOTIFY_MAX_BATCH = 3
+_NOTIF_BUFFER = []
+_NOTIF_LOCK = threading.Lock()
+
+def queue_manager_notification(message):
+    """Queue a manager notification for the next batched flush"""
+    with _NOTIF_LOCK:
+        _NOTIF_BUFFER.append(message)
+
+def _flush_manager_notifications():
+    """Send every queued manager notification, MANAGER_NOTIFY_MAX_BATCH per SMS"""
+    with _NOTIF_LOCK:
+        batch = _NOTIF_BUFFER[:]
+        _NOTIF_BUFFER.clear()
+    for i in range(0, len(batch), MANAGER_NOTIFY_MAX_BATCH):
+        try:
+            notify_managers("\n---\n".join(batch[i:i + MANAGER_NOTIFY_MAX_BATCH]))
+        except Exception:
+            logger.exception("Error flushing manager notifications")
+
+def _manager_notification_worker():
+    """Background loop that flushes queued manager notifications"""
+    while True:
+        time.sleep(MANAGER_NOTIFY_INTERVAL)
+        _flush_manager_notifications()
 
 
 # ============================================================================
@@ -464,8 +906,11 @@ def notify_managers(message):
 def create_reservation():
     """Handle reservation form submission"""
     try:
-        data = request.json
-        logger.info(f"Received reservation: {data}")
+        # Parsed once and not cached on the request; bad bodies are a 400, not a 500
+        data = request.get_json(silent=True, cache=False)
+        if not isinstance(data, dict):
+            return jsonify({'success': False, 'message': 'Datos inválidos'}), 400
+        logger.info("Received reservation: %s", data)
         
         # Validate required fields
         required_fields = ['nombre', 'telefono', 'personas', 'fecha', 'hora']
@@ -476,21 +921,49 @@ def create_reservation():
                     'message': f'Campo requerido: {field}'
                 }), 400
         
+        # Reject malformed input before touching the DB
+        if len(str(data['nombre'])) > MAX_NOMBRE_LEN:
+            return jsonify({'success': False, 'message': 'Nombre demasiado largo'}), 400
+        if len(str(data['telefono'])) > MAX_TELEFONO_LEN:
+            return jsonify({'success': False, 'message': 'Teléfono inválido'}), 400
+        if not is_valid_fecha(str(data['fecha'])):
+            return jsonify({'success': False, 'message': 'Fecha inválida'}), 400
+        if not _TIME_RE(str(data['hora'])):
+            return jsonify({'success': False, 'message': 'Hora inválida'}), 400
+        try:
+            personas = int(data['personas'])
+        except (TypeError, ValueError):
+            personas = 0
+        if not 1 <= personas <= MAX_PERSONAS:
+            return jsonify({'success': False, 'message': 'Número de personas inválido'}), 400
+        
         # Clean phone number
         clean_phone = clean_phone_number(data['telefono'])
         
-        # Check for duplicate reservations (only active, user-confirmed future ones count)
-        with get_db() as conn:
+        # Generate confirmation token: 96 random bits, 16 URL-safe chars (no padding)
+        confirmation_token = base64.urlsafe_b64encode(secrets.token_bytes(12)).decode('ascii')
+        
+        # Check if large group (determines auto-approval)
+        is_large = is_large_group(personas)
+        
+        # Sample the clock once for the duplicate and booking-time checks
+        current = now()
+        
+        # Duplicate check, blocked-hour check and insert share one BEGIN
+        # IMMEDIATE transaction, so nothing can slip in between them
+        with db_transaction() as conn:
             cursor = conn.cursor()
+            
+            # Check for duplicate reservations (only active, user-confirmed future ones count)
             cursor.execute('''
-                SELECT * FROM reservations 
+                SELECT fecha, hora FROM reservations 
                 WHERE telefono = ? 
                 AND user_confirmed = 1
                 AND cancelled = 0
-                AND date(fecha) >= date('now', 'localtime')
+                AND fecha >= ?
                 ORDER BY fecha, hora
                 LIMIT 1
-            ''', (clean_phone,))
+            ''', (clean_phone, current.date().isoformat()))
             existing = cursor.fetchone()
             
             if existing:
@@ -499,28 +972,19 @@ def create_reservation():
                     'success': False,
                     'message': f'Ya tienes una reserva activa para el {fecha_display} a las {existing["hora"]}. Si necesitas cambiarla, usa el enlace de cancelación que te enviamos por SMS.'
                 }), 400
-        
-        # Validate booking time
-        allowed, reason = is_booking_allowed(data['fecha'], data['hora'])
-        if not allowed:
-            return jsonify({
-                'success': False,
-                'message': reason
-            }), 400
-        
-        # Generate confirmation token
-        confirmation_token = secrets.token_urlsafe(16)
-        
-        # Check if large group (determines auto-approval)
-        personas = int(data['personas'])
-        is_large = is_large_group(personas)
-        
-        # Insert into database
-        # Small groups: restaurant pre-approved (restaurant_confirmed=1)
-        # Large groups: need approval (restaurant_confirmed=0)
-        # BUT user still needs to click SMS link (user_confirmed=0)
-        with get_db() as conn:
-            cursor = conn.cursor()
+            
+            # Validate booking time
+            allowed, reason = is_booking_allowed(data['fecha'], data['hora'], current, conn)
+            if not allowed:
+                return jsonify({
+                    'success': False,
+                    'message': reason
+                }), 400
+            
+            # Insert into database
+            # Small groups: restaurant pre-approved (restaurant_confirmed=1)
+            # Large groups: need approval (restaurant_confirmed=0)
+            # BUT user still needs to click SMS link (user_confirmed=0)
             cursor.execute('''
                 INSERT INTO reservations 
                 (nombre, telefono, personas, fecha, hora, 
@@ -538,11 +1002,12 @@ def create_reservation():
                 confirmation_token,
                 data.get('notes','')
             ))
-            conn.commit()
             reservation_id = cursor.lastrowid
-        
-        # Log action
-        log_action(reservation_id, 'created', 'web_form', f'Group size: {personas}, Auto-approved: {not is_large}')
+            
+            # Log action
+            log_action(reservation_id, 'created', 'web_form',
+                       f'Group size: {personas}, Auto-approved: {not is_large}', conn=conn)
+        invalidate_calendar_cache()
         
         # Create confirmation link
         confirmation_link = f"{DOMAIN}confirm/{confirmation_token}"
@@ -551,40 +1016,30 @@ def create_reservation():
         fecha_display = format_date_spanish(data['fecha'])
         
         # Prepare SMS message - MORE NATURAL
-        if is_large:
-            sms_message = (
-                f"{data['nombre']}, CONFIRMA AQUÍ (confirm here):\n"
-                f"{confirmation_link}\n"
-                f"{fecha_display} {data['hora']} - {personas} pers.\n"
-                f"Revisaremos disponibilidad.\n"
-                f"Les Monges"
-            )
-        else:
-            sms_message = (
-                f"{data['nombre']}, confirma tu reserva (confirm):\n"
-                f"{confirmation_link}\n"
-                f"{fecha_display} {data['hora']} - {personas} pers.\n"
-                f"Les Monges"
-            )
-        # Send SMS
-        sms_sent = send_sms(clean_phone, sms_message)
-        
-        if not sms_sent:
-            logger.warning(f"SMS failed for reservation {reservation_id}")
+        sms_message = (SMS_CREATED_LARGE if is_large else SMS_CREATED_SMALL).format_map({
+            'nombre': data['nombre'],
+            'confirmation_link': confirmation_link,
+            'fecha_display': fecha_display,
+            'hora': data['hora'],
+            'personas': personas,
+        })
+        # Send SMS in the background; delivery failures land in the action log,
+        # so the response can only say whether it was queued
+        sms_queued = send_sms_async(clean_phone, sms_message, reservation_id)
         
-        logger.info(f"✅ Reservation created: ID={reservation_id}, Token={confirmation_token}")
+        logger.info("✅ Reservation created: ID=%s, Token=%s", reservation_id, confirmation_token)
         log_metric('reservation_created', 
                    id=reservation_id,
                    personas=personas,
                    fecha=data['fecha'],
                    hora=data['hora'],
                    large_group=is_large,
-                   sms_sent=sms_sent)
+                   sms_queued=sms_queued)
         return jsonify({
             'success': True,
             'reservation_id': reservation_id,
             'large_group': is_large,
-            'sms_sent': sms_sent,
+            'sms_queued': sms_queued,
             'message': 'Reserva registrada. Revisa tu móvil para confirmar.'
         })
         
@@ -599,32 +1054,30 @@ def create_reservation():
 def api_available_hours():
     """Get available hours for a specific date (for frontend)"""
     try:
-        # Load fresh hours from file
-        load_default_hours_from_file()
-        
         fecha = request.args.get('fecha')
         if not fecha:
             return jsonify({'success': False, 'message': 'Fecha requerida'}), 400
+        # fromisoformat alone also accepts 20261019 and 2026-W42-1
+        if not is_valid_fecha(fecha):
+            return jsonify({'success': False, 'message': 'Fecha inválida'}), 400
+        
+        fecha_date = date.fromisoformat(fecha)
+        current = now()
+        today = current.date()
+        
+        # No bookings for past dates, nor for today after 7 PM: skip file and DB
+        if fecha_date < today or (fecha_date == today and current.hour >= 19):
+            return jsonify({'success': True, 'hours': [], 'all_blocked': True})
+        
+        # The hours may have been edited through another worker's admin panel
+        load_default_hours_from_file()
         
         # Get available hours (not blocked)
         available = get_available_hours_for_date(fecha)
         
-        # Additional filtering for today
-        fecha_date = datetime.strptime(fecha, '%Y-%m-%d').date()
-        today = now().date()
-        
+        # Before 7 PM (19:00), only show evening slots (>= 19:00) for today
         if fecha_date == today:
-            current_hour = now().hour
-            
-            # Before 7 PM (19:00), only show evening slots (>= 19:00)
-            if current_hour < 19:
-                available = [h for h in available if datetime.strptime(h, '%H:%M').time().hour >= 19]
-            else:
-                # After 7 PM, no bookings for today
-                available = []
-        elif fecha_date < today:
-            # No bookings for past dates
-            available = []
+            available = [h for h in available if int(h[:2]) >= 19]
         
         return jsonify({
             'success': True,
@@ -636,522 +1089,303 @@ def api_available_hours():
         logger.error(f"Error getting available hours: {str(e)}")
         return jsonify({'success': False, 'message': str(e)}), 500
 
+# ============================================================================
+# STATIC ERROR PAGES - Encoded and gzipped once at import
+# ============================================================================
+
+INVALID_TOKEN_HTML = '''<!DOCTYPE html>
+<html lang="es">
+<head>
+    <meta charset="UTF-8">
+    <meta name="viewport" content="width=device-width, initial-scale=1.0">
+    <title>Error - Les Monges</title>
+    <style>
+        body { font-family: Georgia, serif; display: flex; justify-content: center;
+               align-items: center; min-height: 100vh; margin: 0; background: #f5f5f5; }
+        .container { text-align: center; padding: 40px; background: white;
+                    border-radius: 10px; box-shadow: 0 2px 10px rgba(0,0,0,0.1); max-width: 500px; }
+        h1 { color: #dc3545; }
+        p { color: #666; margin: 20px 0; }
+        a { display: inline-block; margin-top: 20px; padding: 10px 20px;
+           background: #28a428; color: white; text-decoration: none; border-radius: 5px; }
+    </style>
+</head>
+<body>
+    <div class="container">
+        <h1>⚠️ Enlace inválido o expirado</h1>
+        <p>Esta reserva no existe, ya fue confirmada o cancelada, o ya pasó la fecha.</p>
+        <a href="/">Volver al inicio</a>
+    </div>
+</body>
+</html>
+'''.encode('utf-8')
+
+INVALID_TOKEN_HTML_GZ = gzip.compress(INVALID_TOKEN_HTML, 9)
+
+# Tokens are 16 URL-safe characters (22 for links issued before the switch
+# from token_urlsafe(16))
+_TOKEN_RE = re.compile(r'[A-Za-z0-9_-]{16}(?:[A-Za-z0-9_-]{6})?').fullmatch
+
+def _accepts_gzip():
+    """Client's Accept-Encoding allows gzip (q=0 refuses it, * allows it)"""
+    return request.accept_encodings['gzip'] > 0
+
+def _maybe_gz(body_bytes, body_gz):
+    """Serve the precompressed body when the client accepts gzip"""
+    headers = {'Vary': 'Accept-Encoding'}
+    if _accepts_gzip():
+        headers['Content-Encoding'] = 'gzip'
+        return Response(body_gz, mimetype='text/html', headers=headers)
+    return Response(body_bytes, mimetype='text/html', headers=headers)
+
+def invalid_token_response():
+    """Shared invalid/expired link page for confirm and cancel"""
+    return _maybe_gz(INVALID_TOKEN_HTML, INVALID_TOKEN_HTML_GZ)
+
+# Link-preview crawlers and scanners fetch SMS links before the customer does
+_PREVIEW_BOT_RE = re.compile(
+    r'facebookexternalhit|WhatsApp|Twitterbot|Slackbot|LinkedInBot|'
+    r'TelegramBot|Discordbot|SkypeUriPreview|bingbot|Googlebot',
+    re.IGNORECASE
+).search
+
+LINK_PREVIEW_HTML = f'''<!DOCTYPE html>
+<html lang="es">
+<head>
+    <meta charset="UTF-8">
+    <meta property="og:title" content="Tu reserva - {RESTAURANT_NAME}">
+    <meta property="og:description" content="Abre el enlace para ver o confirmar tu reserva.">
+    <title>Tu reserva - {RESTAURANT_NAME}</title>
+</head>
+<body></body>
+</html>
+'''.encode('utf-8')
+
+def is_link_preview():
+    """HEAD probes and known preview bots: answer without touching the DB"""
+    return (request.method == 'HEAD'
+            or _PREVIEW_BOT_RE(request.headers.get('User-Agent', '')) is not None)
+
+def link_preview_response():
+    """Tiny OG-tags-only page for link previews"""
+    response = Response(LINK_PREVIEW_HTML, mimetype='text/html')
+    response.headers['Cache-Control'] = 'private, max-age=0'
+    return response
+
+def request_log_extra():
+    """Client IP and User-Agent as structured log fields (logger `extra=`)"""
+    return {
+        'client_ip': request.headers.get('X-Forwarded-For', request.remote_addr),
+        'user_agent': request.headers.get('User-Agent', ''),
+    }
+
 # ============================================================================
 # CONFIRMATION & CANCELLATION ENDPOINTS
 # ============================================================================
 
+# Tokens confirmed in the last 30s; a double-tapped button skips the DB
+_RECENT_CONFIRMS = TTLCache(maxsize=10000, ttl=30)
+
+# Tokens that matched no live reservation (unknown, cancelled or past). Such
+# a token never becomes valid again, so re-fetches skip SQLite and, for
+# /cancel, the write lock. Live rows are not cached: their state changes.
+_DEAD_TOKENS = TTLCache(maxsize=10000, ttl=30)
+
 @app.route('/confirm/<token>', methods=['GET', 'POST'])
 def confirm_reservation(token):
     """Handle customer confirmation via SMS link"""
+    # Reject malformed tokens (scanners, truncated links) before touching the DB
+    if not _TOKEN_RE(token):
+        return invalid_token_response()
+    if is_link_preview():
+        return link_preview_response()
+    if _DEAD_TOKENS.get(token):
+        return invalid_token_response()
+
+    logger.info("Confirmation attempt - Token: %s, Method: %s",
+                token, request.method, extra=request_log_extra())
+    
+    # GET request: Show confirmation button OR show already-confirmed status
+    if request.method == 'GET':
+        try:
+            # Look for ANY non-cancelled FUTURE reservation with this token
+            reservation = get_read_conn().execute('''
+                SELECT id, nombre, telefono, personas, fecha, hora,
+                       user_confirmed, restaurant_confirmed, confirmation_token
+                FROM reservations 
+                WHERE confirmation_token = ? 
+                AND cancelled = 0
+                AND fecha || ' ' || hora >= ?
+            ''', (token, now_stamp())).fetchone()
+        except sqlite3.OperationalError:
+            logger.exception("Error confirming reservation")
+            return "Error procesando la confirmación", 500
+        
+        # Invalid token, cancelled, or past reservation
+        if not reservation:
+            logger.warning("Invalid token, cancelled, or past reservation: %s", token)
+            _DEAD_TOKENS[token] = True
+            return invalid_token_response()
+        
+        # Format date for display
+        fecha_display = format_date_spanish(reservation['fecha'])
+        cancel_link = f"{DOMAIN}/cancel/{reservation['confirmation_token']}"
+        
+        # If NOT confirmed yet (user_confirmed = 0), show confirmation button
+        if not reservation['user_confirmed']:
+            logger.info("Showing confirmation button for reservation %s", reservation['id'])
+            return render_template('confirm_pending.html',
+                                   reservation=reservation,
+                                   fecha_display=fecha_display,
+                                   restaurant_name=RESTAURANT_NAME)
+        
+        # Already confirmed (user_confirmed = 1), show info/cancel page
+        logger.info("User revisiting already confirmed reservation %s", reservation['id'])
+        
+        return render_template('confirm_done.html',
+                               reservation=reservation,
+                               fecha_display=fecha_display,
+                               confirmed=reservation['restaurant_confirmed'],
+                               cancel_link=cancel_link,
+                               restaurant_name=RESTAURANT_NAME)
+    
+    # POST request: Actually confirm (only real users will POST). Anything
+    # else (HEAD probes, scanners) must never reach the state change below.
+    if request.method != 'POST':
+        abort(405)
+    if _RECENT_CONFIRMS.get(token):
+        logger.info("Repeated confirmation POST for token %s", token)
+        return redirect(url_for('confirm_reservation', token=token), code=303)
     try:
-        # Log User-Agent for debugging
-        user_agent = request.headers.get('User-Agent', '')
-        client_ip = request.headers.get('X-Forwarded-For', request.remote_addr)
-        logger.info(f"Confirmation attempt - Token: {token}, IP: {client_ip}, Method: {request.method}")
-        
-        # GET request: Show confirmation button OR show already-confirmed status
-        if request.method == 'GET':
-            with get_db() as conn:
-                cursor = conn.cursor()
-                
-                # Look for ANY non-cancelled FUTURE reservation with this token
-                cursor.execute('''
-                    SELECT * FROM reservations 
-                    WHERE confirmation_token = ? 
-                    AND cancelled = 0
-                    AND datetime(fecha || ' ' || hora) >= datetime('now', 'localtime')
-                ''', (token,))
-                
-                reservation = cursor.fetchone()
-                
-                # Invalid token, cancelled, or past reservation
-                # Invalid token, cancelled, or past reservation
-                if not reservation:
-                    logger.warning(f"Invalid token, cancelled, or past reservation: {token}")
-                    return '''
-                        <!DOCTYPE html>
-                        <html lang="es">
-                        <head>
-                            <meta charset="UTF-8">
-                            <meta name="viewport" content="width=device-width, initial-scale=1.0">
-                            <title>Error - Les Monges</title>
-                            <style>
-                                body { font-family: Georgia, serif; display: flex; justify-content: center; 
-                                       align-items: center; min-height: 100vh; margin: 0; background: #f5f5f5; }
-                                .container { text-align: center; padding: 40px; background: white; 
-                                            border-radius: 10px; box-shadow: 0 2px 10px rgba(0,0,0,0.1); max-width: 500px; }
-                                h1 { color: #dc3545; }
-                                p { color: #666; margin: 20px 0; }
-                                a { display: inline-block; margin-top: 20px; padding: 10px 20px; 
-                                   background: #28a428; color: white; text-decoration: none; border-radius: 5px; }
-                            </style>
-                        </head>
-                        <body>
-                            <div class="container">
-                                <h1>⚠️ Enlace inválido o expirado</h1>
-                                <p>Esta reserva no existe, ya fue cancelada, o ya pasó la fecha.</p>
-                                <a href="/">Volver al inicio</a>
-                            </div>
-                        </body>
-                        </html>
-                    '''
-                
-                # Format date for display
-                fecha_display = format_date_spanish(reservation['fecha'])
-                is_large = is_large_group(reservation['personas'])
-                cancel_link = f"{DOMAIN}/cancel/{reservation['confirmation_token']}"
-                
-                # If NOT confirmed yet (user_confirmed = 0), show confirmation button
-                if not reservation['user_confirmed']:
-                    logger.info(f"Showing confirmation button for reservation {reservation['id']}")
-                    return f'''
-                        <!DOCTYPE html>
-                        <html lang="es">
-                        <head>
-                            <meta charset="UTF-8">
-                            <meta name="viewport" content="width=device-width, initial-scale=1.0">
-                            <title>Confirmar Reserva - {RESTAURANT_NAME}</title>
-                            <style>
-                                body {{ font-family: Georgia, serif; display: flex; justify-content: center;
-                                       align-items: center; min-height: 100vh; margin: 0;
-                                       background: linear-gradient(135deg, #faf8f3 0%, #fff 100%); }}
-                                .container {{ text-align: center; padding: 40px; background: white;
-                                            border-radius: 10px; box-shadow: 0 10px 30px rgba(0,0,0,0.1); max-width: 500px; }}
-                                h1 {{ color: #2a2523; margin: 20px 0; }}
-                                p {{ color: #666; line-height: 1.6; margin: 15px 0; }}
-                                .details {{ background: #f9f9f9; padding: 20px; border-radius: 8px; margin: 20px 0; }}
-                                .detail-row {{ display: flex; justify-content: space-between; margin: 10px 0; }}
-                                .detail-label {{ font-weight: bold; color: #333; }}
-                                .detail-value {{ color: #666; }}
-                                .confirm-btn {{ display: inline-block; margin-top: 20px; padding: 15px 40px;
-                                              background: #32cd32; color: white; text-decoration: none;
-                                              border-radius: 8px; font-size: 1.1rem; font-weight: bold;
-                                              border: none; cursor: pointer; transition: all 0.3s; }}
-                                .confirm-btn:hover {{ background: #28a428; transform: translateY(-2px); }}
-                            </style>
-                        </head>
-                        <body>
-                            <div class="container">
-                                <h1>📋 Confirma tu Reserva</h1>
-                                <div class="details">
-                                    <div class="detail-row">
-                                        <span class="detail-label">Nombre:</span>
-                                        <span class="detail-value">{reservation['nombre']}</span>
-                                    </div>
-                                    <div class="detail-row">
-                                        <span class="detail-label">Fecha:</span>
-                                        <span class="detail-value">{fecha_display}</span>
-                                    </div>
-                                    <div class="detail-row">
-                                        <span class="detail-label">Hora:</span>
-                                        <span class="detail-value">{reservation['hora']}</span>
-                                    </div>
-                                    <div class="detail-row">
-                                        <span class="detail-label">Personas:</span>
-                                        <span class="detail-value">{reservation['personas']}</span>
-                                    </div>
-                                </div>
-                                <form method="POST">
-                                    <button type="submit" class="confirm-btn">✓ Confirmar Reserva</button>
-                                </form>
-                            </div>
-                        </body>
-                        </html>
-                    '''
-                
-                # Already confirmed (user_confirmed = 1), show info/cancel page
-                logger.info(f"User revisiting already confirmed reservation {reservation['id']}")
-                
-                status_message = (
-                    "Tu reserva está confirmada y te esperamos ese día" 
-                    if not is_large or reservation['restaurant_confirmed']
-                    else "Tu solicitud está pendiente de aprobación del restaurante"
-                )
-                
-                return f'''
-                    <!DOCTYPE html>
-                    <html lang="es">
-                    <head>
-                        <meta charset="UTF-8">
-                        <meta name="viewport" content="width=device-width, initial-scale=1.0">
-                        <title>Tu Reserva - {RESTAURANT_NAME}</title>
-                        <style>
-                            body {{ font-family: Georgia, serif; display: flex; justify-content: center;
-                                   align-items: center; min-height: 100vh; margin: 0;
-                                   background: linear-gradient(135deg, #faf8f3 0%, #fff 100%); }}
-                            .container {{ text-align: center; padding: 40px; background: white;
-                                        border-radius: 10px; box-shadow: 0 10px 30px rgba(0,0,0,0.1); max-width: 500px; }}
-                            .checkmark {{ width: 80px; height: 80px; margin: 0 auto 20px; background: #32cd32;
-                                        border-radius: 50%; display: flex; align-items: center;
-                                        justify-content: center; font-size: 40px; color: white; }}
-                            h1 {{ color: #2a2523; margin: 20px 0; }}
-                            p {{ color: #666; line-height: 1.6; margin: 15px 0; }}
-                            .details {{ background: #f9f9f9; padding: 20px; border-radius: 8px; margin: 20px 0; }}
-                            .detail-row {{ display: flex; justify-content: space-between; margin: 10px 0; }}
-                            .detail-label {{ font-weight: bold; color: #333; }}
-                            .detail-value {{ color: #666; }}
-                            a {{ display: inline-block; margin-top: 20px; padding: 12px 30px;
-                                background: transparent; color: #666; text-decoration: none;
-                                border: 2px solid #ddd; border-radius: 5px; transition: all 0.3s; }}
-                            a:hover {{ background: #32cd32; color: white; border-color: #32cd32; }}
-                            .cancel-btn {{ background: #dc3545; color: white; border-color: #dc3545; font-weight: bold; }}
-                            .cancel-btn:hover {{ background: #c82333; border-color: #c82333; }}
-                            .pending-approval {{ background: #fff3cd; border: 2px solid #ffc107;
-                                              padding: 15px; border-radius: 8px; margin: 20px 0; }}
-                            .actions {{ margin-top: 30px; padding-top: 20px; border-top: 1px solid #ddd; }}
-                        </style>
-                    </head>
-                    <body>
-                        <div class="container">
-                            <div class="checkmark">✓</div>
-                            <h1>{'¡Reserva Confirmada!' if not is_large or reservation['restaurant_confirmed'] else '¡Solicitud Recibida!'}</h1>
-                            <p>{status_message}</p>
-                            {'<div class="pending-approval">⏳ Grupos grandes requieren confirmación del restaurante. Te contactaremos en breve.</div>' if is_large and not reservation['restaurant_confirmed'] else ''}
-                            <div class="details">
-                                <div class="detail-row">
-                                    <span class="detail-label">Nombre:</span>
-                                    <span class="detail-value">{reservation['nombre']}</span>
-                                </div>
-                                <div class="detail-row">
-                                    <span class="detail-label">Fecha:</span>
-                                    <span class="detail-value">{fecha_display}</span>
-                                </div>
-                                <div class="detail-row">
-                                    <span class="detail-label">Hora:</span>
-                                    <span class="detail-value">{reservation['hora']}</span>
-                                </div>
-                                <div class="detail-row">
-                                    <span class="detail-label">Personas:</span>
-                                    <span class="detail-value">{reservation['personas']}</span>
-                                </div>
-                            </div>
-                            <div class="actions">
-                                <p><small>¿Necesitas cancelar tu reserva?</small></p>
-                                <a href="{cancel_link}" class="cancel-btn">✕ Cancelar mi Reserva</a>
-                            </div>
-                            <a href="/">Volver al inicio</a>
-                        </div>
-                    </body>
-                    </html>
-                '''
-        
-        # POST request: Actually confirm (only real users will POST)
-        if request.method == 'POST':
-            with get_db() as conn:
-                cursor = conn.cursor()
-                
-                cursor.execute('''
-                    SELECT * FROM reservations 
-                    WHERE confirmation_token = ? 
-                    AND user_confirmed = 0 
-                    AND cancelled = 0
-                    AND datetime(fecha || ' ' || hora) >= datetime('now', 'localtime')
-                ''', (token,))
-                
-                reservation = cursor.fetchone()
-                
-                if not reservation:
-                    logger.warning(f"Invalid token for POST: {token}")
-                    return '''
-                        <!DOCTYPE html>
-                        <html lang="es">
-                        <head>
-                            <meta charset="UTF-8">
-                            <meta name="viewport" content="width=device-width, initial-scale=1.0">
-                            <title>Error - Les Monges</title>
-                            <style>
-                                body { font-family: Georgia, serif; display: flex; justify-content: center; 
-                                       align-items: center; min-height: 100vh; margin: 0; background: #f5f5f5; }
-                                .container { text-align: center; padding: 40px; background: white; 
-                                            border-radius: 10px; box-shadow: 0 2px 10px rgba(0,0,0,0.1); max-width: 500px; }
-                                h1 { color: #dc3545; }
-                                p { color: #666; margin: 20px 0; }
-                                a { display: inline-block; margin-top: 20px; padding: 10px 20px; 
-                                   background: #28a428; color: white; text-decoration: none; border-radius: 5px; }
-                            </style>
-                        </head>
-                        <body>
-                            <div class="container">
-                                <h1>⚠️ Enlace inválido o expirado</h1>
-                                <p>Esta reserva ya fue confirmada, cancelada, o ya pasó la fecha.</p>
-                                <a href="/">Volver al inicio</a>
-                            </div>
-                        </body>
-                        </html>
-                    '''
-                
-                # Determine confirmation flow based on group size
-                is_large = is_large_group(reservation['personas'])
-                
-                # Format date for display
-                fecha_display = format_date_spanish(reservation['fecha'])
-                
-                if is_large:
-                    # SMS for large group - mention they'll be contacted
-                    message = (
-                        f"Gracias {reservation['nombre']}!\n"
-                        f"Solicitud para {reservation['personas']} pers. recibida.\n"
-                        f"Te confirmaremos pronto.\n"
-                        f"Cancelar: mismo enlace (cancel: same link)"
-                    )
-                    logger.info(f"Large group {reservation['id']} SMS-confirmed, awaiting restaurant approval")
-                else:
-                    # SMS for small group - confirmed! Mention cancellation link
-                    message = (
-                        f"¡Confirmado {reservation['nombre']}!\n"
-                        f"{fecha_display} {reservation['hora']}, {reservation['personas']} pers.\n"
-                        f"¡Te esperamos!\n"
-                        f"Cancelar: mismo enlace (cancel: same link)"
-                    )
-                    logger.info(f"Small group {reservation['id']} fully confirmed")
-                
-                # Update database - mark user as confirmed
-                cursor.execute('''
-                    UPDATE reservations 
-                    SET user_confirmed = 1
-                    WHERE id = ?
-                ''', (reservation['id'],))
-                conn.commit()
-                
-                # Log action
-                log_action(reservation['id'], 'user_confirmed', 'customer', 'Via SMS link')
-                # log metric
-                log_metric('user_confirmed',
-                   id=reservation['id'],
-                   personas=reservation['personas'],
-                   fecha=reservation['fecha'],
-                   hora=reservation['hora'],
-                   large_group=is_large)
-                # Send confirmation SMS
-                send_sms(reservation['telefono'], message)
-
-                # Notify managers of new confirmed/pending reservation
-                manager_notif = (
-                    f"Nueva reserva {'PENDIENTE' if is_large else 'CONFIRMADA'}: "
-                    f"{fecha_display} {reservation['hora']}. "
-                    f"{reservation['personas']} personas, {reservation['nombre']}. "
-                    f"Tel: {reservation['telefono']}"
-                )
-                notify_managers(manager_notif)
-
-                # Create cancellation link
-                cancel_link = f"{DOMAIN}/cancel/{reservation['confirmation_token']}"
-                
-                return f'''
-                    <!DOCTYPE html>
-                    <html lang="es">
-                    <head>
-                        <meta charset="UTF-8">
-                        <meta name="viewport" content="width=device-width, initial-scale=1.0">
-                        <title>Reserva Confirmada - {RESTAURANT_NAME}</title>
-                        <style>
-                            body {{ font-family: Georgia, serif; display: flex; justify-content: center;
-                                   align-items: center; min-height: 100vh; margin: 0;
-                                   background: linear-gradient(135deg, #faf8f3 0%, #fff 100%); }}
-                            .container {{ text-align: center; padding: 40px; background: white;
-                                        border-radius: 10px; box-shadow: 0 10px 30px rgba(0,0,0,0.1); max-width: 500px; }}
-                            .checkmark {{ width: 80px; height: 80px; margin: 0 auto 20px; background: #32cd32;
-                                        border-radius: 50%; display: flex; align-items: center;
-                                        justify-content: center; font-size: 40px; color: white; }}
-                            h1 {{ color: #2a2523; margin: 20px 0; }}
-                            p {{ color: #666; line-height: 1.6; margin: 15px 0; }}
-                            .details {{ background: #f9f9f9; padding: 20px; border-radius: 8px; margin: 20px 0; }}
-                            .detail-row {{ display: flex; justify-content: space-between; margin: 10px 0; }}
-                            .detail-label {{ font-weight: bold; color: #333; }}
-                            .detail-value {{ color: #666; }}
-                            a {{ display: inline-block; margin-top: 20px; padding: 12px 30px;
-                                background: transparent; color: #666; text-decoration: none;
-                                border: 2px solid #ddd; border-radius: 5px; transition: all 0.3s; }}
-                            a:hover {{ background: #32cd32; color: white; border-color: #32cd32; }}
-                            .cancel-btn {{ background: #dc3545; color: white; border-color: #dc3545; font-weight: bold; }}
-                            .cancel-btn:hover {{ background: #c82333; border-color: #c82333; }}
-                            .pending-approval {{ background: #fff3cd; border: 2px solid #ffc107;
-                                              padding: 15px; border-radius: 8px; margin: 20px 0; }}
-                            .actions {{ margin-top: 30px; padding-top: 20px; border-top: 1px solid #ddd; }}
-                        </style>
-                    </head>
-                    <body>
-                        <div class="container">
-                            <div class="checkmark">✓</div>
-                            <h1>{'¡Reserva Confirmada!' if not is_large else '¡Solicitud Recibida!'}</h1>
-                            <p>{message}</p>
-                            {'<div class="pending-approval">⏳ Grupos grandes requieren confirmación del restaurante. Te contactaremos en breve.</div>' if is_large else ''}
-                            <div class="details">
-                                <div class="detail-row">
-                                    <span class="detail-label">Fecha:</span>
-                                    <span class="detail-value">{fecha_display}</span>
-                                </div>
-                                <div class="detail-row">
-                                    <span class="detail-label">Hora:</span>
-                                    <span class="detail-value">{reservation['hora']}</span>
-                                </div>
-                                <div class="detail-row">
-                                    <span class="detail-label">Personas:</span>
-                                    <span class="detail-value">{reservation['personas']}</span>
-                                </div>
-                            </div>
-                            <p><small>Te hemos enviado un SMS de confirmación</small></p>
-                            <div class="actions">
-                                <p><small>¿Necesitas cancelar?</small></p>
-                                <a href="{cancel_link}" class="cancel-btn">✕ Cancelar mi Reserva</a>
-                            </div>
-                            <a href="/">Volver al inicio</a>
-                        </div>
-                    </body>
-                    </html>
-                '''
+        with db_transaction() as conn:
+            # Confirm atomically; the WHERE clause re-checks the row's state
+            reservation = conn.execute('''
+                UPDATE reservations 
+                SET user_confirmed = 1
+                WHERE confirmation_token = ? 
+                AND user_confirmed = 0 
+                AND cancelled = 0
+                AND fecha || ' ' || hora >= ?
+                RETURNING id, nombre, telefono, personas, fecha, hora, restaurant_confirmed
+            ''', (token, now_stamp())).fetchone()
             
-    except Exception as e:
-        logger.error(f"Error confirming reservation: {str(e)}")
+            if reservation:
+                log_action(reservation['id'], 'user_confirmed', 'customer', 'Via SMS link', conn=conn)
+    except sqlite3.OperationalError:
+        logger.exception("Error confirming reservation")
         return "Error procesando la confirmación", 500
+    
+    if not reservation:
+        logger.warning("Invalid token for POST: %s", token)
+        return invalid_token_response()
+    _RECENT_CONFIRMS[token] = True
+    invalidate_calendar_cache()
+    
+    # Determine confirmation flow: create_reservation stores restaurant_confirmed = 0
+    # exactly for large groups, and it stays 0 until the restaurant approves
+    is_large = not reservation['restaurant_confirmed']
+    
+    # Format date for display
+    fecha_display = format_date_spanish(reservation['fecha'])
+    
+    sms_fields = {**reservation, 'fecha_display': fecha_display}
+    if is_large:
+        # SMS for large group - mention they'll be contacted
+        message = SMS_CONFIRMED_LARGE.format_map(sms_fields)
+        logger.info("Large group %s SMS-confirmed, awaiting restaurant approval", reservation['id'])
+    else:
+        # SMS for small group - confirmed! Mention cancellation link
+        message = SMS_CONFIRMED_SMALL.format_map(sms_fields)
+        logger.info("Small group %s fully confirmed", reservation['id'])
+    
+    # log metric
+    log_metric('user_confirmed',
+       id=reservation['id'],
+       personas=reservation['personas'],
+       fecha=reservation['fecha'],
+       hora=reservation['hora'],
+       large_group=is_large)
+    # Send confirmation SMS
+    send_sms_async(reservation['telefono'], message, reservation['id'])
+
+    # Notify managers of new confirmed/pending reservation
+    manager_notif = MANAGER_NEW_RESERVATION.format_map(
+        {**sms_fields, 'estado': 'PENDIENTE' if is_large else 'CONFIRMADA'}
+    )
+    queue_manager_notification(manager_notif)
+
+    # Post/Redirect/Get: the GET branch renders the already-confirmed page,
+    # so a browser refresh never re-submits the confirmation
+    return redirect(url_for('confirm_reservation', token=token), code=303)
 
 @app.route('/cancel/<token>', methods=['GET'])
 def cancel_reservation(token):
     """Handle customer cancellation via link"""
+    if not _TOKEN_RE(token):
+        return invalid_token_response()
+    # A preview bot must never cancel a reservation by fetching the link
+    if is_link_preview():
+        return link_preview_response()
+    if _DEAD_TOKENS.get(token):
+        return invalid_token_response()
+
+    logger.info("Cancellation attempt with token: %s", token, extra=request_log_extra())
+    
     try:
-        logger.info(f"Cancellation attempt with token: {token}")
-        
-        with get_db() as conn:
-            cursor = conn.cursor()
-            
-            cursor.execute('''
-                SELECT * FROM reservations
+        with db_transaction() as conn:
+            reservation = conn.execute('''
+                SELECT id, nombre, telefono, personas, fecha, hora FROM reservations
                 WHERE confirmation_token = ?
                 AND cancelled = 0
-                AND datetime(fecha || ' ' || hora) >= datetime('now', 'localtime')
-            ''', (token,))
-            
-            reservation = cursor.fetchone()
-            
-            if not reservation:
-                logger.warning(f"Invalid token or already cancelled: {token}")
-                return '''
-                    <!DOCTYPE html>
-                    <html lang="es">
-                    <head>
-                        <meta charset="UTF-8">
-                        <meta name="viewport" content="width=device-width, initial-scale=1.0">
-                        <title>Error - Les Monges</title>
-                        <style>
-                            body { font-family: Georgia, serif; display: flex; justify-content: center;
-                                   align-items: center; min-height: 100vh; margin: 0; background: #f5f5f5; }
-                            .container { text-align: center; padding: 40px; background: white;
-                                        border-radius: 10px; box-shadow: 0 2px 10px rgba(0,0,0,0.1); max-width: 500px; }
-                            h1 { color: #dc3545; }
-                            p { color: #666; margin: 20px 0; }
-                            a { display: inline-block; margin-top: 20px; padding: 10px 20px;
-                               background: #28a428; color: white; text-decoration: none; border-radius: 5px; }
-                        </style>
-                    </head>
-                    <body>
-                        <div class="container">
-                            <h1>⚠️ Enlace inválido</h1>
-                            <p>Esta reserva ya fue cancelada o el enlace no es válido.</p>
-                            <a href="/">Volver al inicio</a>
-                        </div>
-                    </body>
-                    </html>
-                '''
-            
-            # Format date for display
-            fecha_display = format_date_spanish(reservation['fecha'])
-            
-            # Cancel the reservation
-            cursor.execute('''
-                UPDATE reservations 
-                SET cancelled = 1, 
-                    cancelled_at = CURRENT_TIMESTAMP, 
-                    cancelled_by = 'customer'
-                WHERE id = ?
-            ''', (reservation['id'],))
-            conn.commit()
-            
-            # Log action
-            log_action(reservation['id'], 'cancelled', 'customer', 'Via cancellation link')
-            #and metric
-            log_metric('reservation_cancelled',
-               id=reservation['id'],
-               personas=reservation['personas'],
-               fecha=reservation['fecha'],
-               hora=reservation['hora'],
-               cancelled_by='customer')
-            logger.info(f"Reservation {reservation['id']} cancelled by customer")
-            
-            # Send cancellation SMS
-            cancel_message = (
-                f"{reservation['nombre']}, reserva cancelada (reservation cancelled)\n"
-                f"{fecha_display} {reservation['hora']}, {reservation['personas']} pers.\n"
-                f"¡Esperamos verte pronto! Hope to see you soon!"
-            )
-
-            send_sms(reservation['telefono'], cancel_message)
-            # Notify managers of cancellation
-            manager_cancel_notif = (
-                f"Cancelación: {reservation['nombre']}, "
-                f"{reservation['personas']} personas, "
-                f"{fecha_display} {reservation['hora']}. "
-                f"Tel: {reservation['telefono']}"
-            )
-            notify_managers(manager_cancel_notif)
+                AND fecha || ' ' || hora >= ?
+            ''', (token, now_stamp())).fetchone()
             
-            return f'''
-                <!DOCTYPE html>
-                <html lang="es">
-                <head>
-                    <meta charset="UTF-8">
-                    <meta name="viewport" content="width=device-width, initial-scale=1.0">
-                    <title>Reserva Cancelada - {RESTAURANT_NAME}</title>
-                    <style>
-                        body {{ font-family: Georgia, serif; display: flex; justify-content: center;
-                               align-items: center; min-height: 100vh; margin: 0;
-                               background: linear-gradient(135deg, #fff5f5 0%, #fff 100%); }}
-                        .container {{ text-align: center; padding: 40px; background: white;
-                                    border-radius: 10px; box-shadow: 0 10px 30px rgba(0,0,0,0.1); max-width: 500px; }}
-                        .icon {{ width: 80px; height: 80px; margin: 0 auto 20px; background: #dc3545;
-                                border-radius: 50%; display: flex; align-items: center;
-                                justify-content: center; font-size: 40px; color: white; }}
-                        h1 {{ color: #2a2523; margin: 20px 0; }}
-                        p {{ color: #666; line-height: 1.6; margin: 15px 0; }}
-                        .details {{ background: #f9f9f9; padding: 20px; border-radius: 8px; margin: 20px 0; }}
-                        .detail-row {{ display: flex; justify-content: space-between; margin: 10px 0; }}
-                        .detail-label {{ font-weight: bold; color: #333; }}
-                        .detail-value {{ color: #666; text-decoration: line-through; }}
-                        a {{ display: inline-block; margin-top: 20px; padding: 12px 30px;
-                            background: #28a428; color: white; text-decoration: none;
-                            border-radius: 5px; transition: all 0.3s; }}
-                        a:hover {{ background: #218838; }}
-                    </style>
-                </head>
-                <body>
-                    <div class="container">
-                        <div class="icon">✕</div>
-                        <h1>Reserva Cancelada</h1>
-                        <p>Tu reserva ha sido cancelada exitosamente.</p>
-                        <div class="details">
-                            <div class="detail-row">
-                                <span class="detail-label">Fecha:</span>
-                                <span class="detail-value">{fecha_display}</span>
-                            </div>
-                            <div class="detail-row">
-                                <span class="detail-label">Hora:</span>
-                                <span class="detail-value">{reservation['hora']}</span>
-                            </div>
-                            <div class="detail-row">
-                                <span class="detail-label">Personas:</span>
-                                <span class="detail-value">{reservation['personas']}</span>
-                            </div>
-                        </div>
-                        <p><small>Te hemos enviado un SMS de confirmación de la cancelación</small></p>
-                        <p>¡Esperamos verte pronto en {RESTAURANT_NAME}!</p>
-                        <a href="/">Hacer una nueva reserva</a>
-                    </div>
-                </body>
-                </html>
-            '''
-            
-    except Exception as e:
-        logger.error(f"Error cancelling reservation: {str(e)}")
+            if reservation:
+                # Cancel the reservation
+                conn.execute('''
+                    UPDATE reservations 
+                    SET cancelled = 1, 
+                        cancelled_at = CURRENT_TIMESTAMP, 
+                        cancelled_by = 'customer'
+                    WHERE id = ?
+                ''', (reservation['id'],))
+                log_action(reservation['id'], 'cancelled', 'customer', 'Via cancellation link', conn=conn)
+    except sqlite3.OperationalError:
+        logger.exception("Error cancelling reservation")
         return "Error procesando la cancelación", 500
+    
+    if not reservation:
+        logger.warning("Invalid token or already cancelled: %s", token)
+        _DEAD_TOKENS[token] = True
+        return invalid_token_response()
+    _DEAD_TOKENS[token] = True
+    invalidate_calendar_cache()
+    
+    # Format date for display
+    fecha_display = format_date_spanish(reservation['fecha'])
+    
+    #and metric
+    log_metric('reservation_cancelled',
+       id=reservation['id'],
+       personas=reservation['personas'],
+       fecha=reservation['fecha'],
+       hora=reservation['hora'],
+       cancelled_by='customer')
+    logger.info("Reservation %s cancelled by customer", reservation['id'])
+    
+    # Send cancellation SMS
+    sms_fields = {**reservation, 'fecha_display': fecha_display}
+    cancel_message = SMS_CANCELLED.format_map(sms_fields)
+
+    send_sms_async(reservation['telefono'], cancel_message, reservation['id'])
+    # Notify managers of cancellation
+    manager_cancel_notif = MANAGER_CANCELLATION.format_map(sms_fields)
+    queue_manager_notification(manager_cancel_notif)
+    
+    return render_template('cancel_done.html',
+                           reservation=reservation,
+                           fecha_display=fecha_display,
+                           restaurant_name=RESTAURANT_NAME)
 
 
 
@@ -1159,14 +1393,134 @@ def cancel_reservation(token):
 # STATIC PAGE ROUTES
 # ============================================================================
 
+# gzip bodies of versioned static assets, compressed once at startup
+_STATIC_GZ = {}
+
+def _static_version(filename):
+    """Short content hash of a static file, used to cache-bust its URL"""
+    try:
+        with open(os.path.join(app.static_folder, filename), 'rb') as f:
+            data = f.read()
+    except FileNotFoundError:
+        return '0'
+    _STATIC_GZ[filename] = gzip.compress(data, 9)
+    return hashlib.sha1(data).hexdigest()[:10]
+
+# Stylesheet for the confirm/cancel pages; versioned URLs can be cached forever
+app.jinja_env.globals['css_version'] = _static_version('reserva.css')
+
+@app.after_request
+def cache_versioned_static(response):
+    """Let browsers keep versioned static assets (?v=<hash>) for a year, gzipped"""
+    if request.endpoint == 'static' and 'v' in request.args and response.status_code == 200:
+        response.cache_control.no_cache = None
+        response.cache_control.public = True
+        response.cache_control.max_age = 31536000
+        response.cache_control.immutable = True
+        
+        body_gz = _STATIC_GZ.get(request.view_args.get('filename'))
+        if body_gz is not None:
+            response.vary.add('Accept-Encoding')
+            if _accepts_gzip():
+                etag, _ = response.get_etag()
+                # Release the file send_file opened before swapping the body
+                if hasattr(response.response, 'close'):
+                    response.response.close()
+                response.direct_passthrough = False
+                response.set_data(body_gz)
+                response.headers['Content-Encoding'] = 'gzip'
+                if etag:
+                    response.set_etag(etag + '-gz')
+                # send_file checked If-None-Match against the plain ETag
+                return response.make_conditional(request)
+    return response
+
+# Dynamic HTML/JSON bodies above this size are gzipped on the fly
+COMPRESS_MIN_SIZE = 500
+_COMPRESS_MIMETYPES = frozenset(('text/html', 'application/json'))
+
+@app.after_request
+def compress_response(response):
+    """gzip HTML/JSON responses for clients that accept it"""
+    if (response.status_code != 200
+            or response.mimetype not in _COMPRESS_MIMETYPES
+            or 'Content-Encoding' in response.headers
+            or response.is_streamed
+            or response.direct_passthrough):
+        return response
+    response.vary.add('Accept-Encoding')
+    if not _accepts_gzip():
+        return response
+    body = response.get_data()
+    if len(body) < COMPRESS_MIN_SIZE:
+        return response
+    response.set_data(gzip.compress(body, 6))
+    response.headers['Content-Encoding'] = 'gzip'
+    etag, weak = response.get_etag()
+    if etag:
+        response.set_etag(etag + '-gz', weak)
+    return response
+
+# Static pages are read from disk once per process and served from memory,
+# as (body, gzipped body, etag) so repeat visits can be answered with a 304
+_TEMPLATE_CACHE = {}
+STATIC_PAGE_MAX_AGE = 300  # seconds
+
+# Candidate locations for each static page, first existing one wins
+_PAGE_PATHS = {
+    'index.html': ['templates/index.html'],
+    'txoco.html': ['templates/txoco.html'],
+    'contact.html': ['templates/contact.html'],
+    'success.html': ['templates/success.html', 'success.html'],
+    'error.html': ['templates/error.html', 'error.html'],
+    'admin.html': ['templates/admin.html', 'admin.html'],
+}
+
+def _read_first(paths):
+    """Return the bytes of the first existing file in paths, or None"""
+    for path in paths:
+        try:
+            with open(path, 'rb') as f:
+                return f.read()
+        except FileNotFoundError:
+            continue
+    return None
+
+def _page_entry(body):
+    return (body, gzip.compress(body, 9), hashlib.sha1(body).hexdigest())
+
+def preload_static_pages():
+    """Read every static page once at startup so no request touches the disk"""
+    for name, paths in _PAGE_PATHS.items():
+        body = _read_first(paths)
+        if body is not None:
+            _TEMPLATE_CACHE[name] = _page_entry(body)
+
+def cached_page(name):
+    """Serve a static HTML page from the in-memory cache (conditional GET aware)"""
+    entry = _TEMPLATE_CACHE.get(name)
+    if entry is None:
+        # Page missing at startup (or added since): retry the disk lookup
+        body = _read_first(_PAGE_PATHS[name])
+        if body is None:
+            return f"{name} not found", 404
+        entry = _TEMPLATE_CACHE[name] = _page_entry(body)
+    body, body_gz, etag = entry
+    if _accepts_gzip():
+        response = Response(body_gz, mimetype='text/html')
+        response.headers['Content-Encoding'] = 'gzip'
+        etag += '-gz'
+    else:
+        response = Response(body, mimetype='text/html')
+    response.vary.add('Accept-Encoding')
+    response.set_etag(etag)
+    response.cache_control.max_age = STATIC_PAGE_MAX_AGE
+    return response.make_conditional(request)
+
 @app.route('/tasca-les-monges')
 def home():
     """Serve the main reservation page"""
-    try:
-        with open('templates/index.html', 'r', encoding='utf-8') as f:
-            return f.read()
-    except FileNotFoundError:
-        return "index.html not found", 404
+    return cached_page('index.html')
 
 @app.route('/')
 def index():
@@ -1175,30 +1529,22 @@ def index():
 @app.route('/txoco-bar')
 def txoco_bar():
     """Serve the Txoco Bar landing page"""
-    try:
-        with open('templates/txoco.html', 'r', encoding='utf-8') as f:
-            return f.read()
-    except FileNotFoundError:
-        return "txoco.html not found", 404
+    return cached_page('txoco.html')
 
 @app.route('/contact', methods=['GET'])
 def contact_page():
-    try:
-        with open('templates/contact.html', 'r', encoding='utf-8') as f:
-            return f.read()
-    except FileNotFoundError:
-        return "contact.html not found", 404   
+    return cached_page('contact.html')
 
 @app.route('/contacto', methods=['POST'])
 def contact_form():
     """Handle contact form submission via SendGrid and Discord"""
     try:
         data = request.json
-        logger.info(f"📧 Received contact form: {data}")
+        logger.info("📧 Received contact form: %s", data)
 
         # Honeypot check - if 'website' field is filled, it's a bot
         if data.get('website'):
-            logger.warning(f"🤖 Honeypot triggered! Bot detected from {data.get('email', 'unknown')}")
+            logger.warning("🤖 Honeypot triggered! Bot detected from %s", data.get('email', 'unknown'))
             # Return success to fool the bot
             return jsonify({
                 'success': True,
@@ -1213,16 +1559,15 @@ def contact_form():
             }), 400
         
         # Store contact message in database for Discord bot
-        with get_db() as conn:
+        with db_transaction() as conn:
             cursor = conn.cursor()
             cursor.execute('''
                 INSERT INTO contact_messages (nombre, email, mensaje)
                 VALUES (?, ?, ?)
             ''', (data['nombre'], data['email'], data['mensaje']))
-            conn.commit()
             contact_id = cursor.lastrowid
 
-        logger.info(f"✅ Contact message stored in database (ID: {contact_id})")
+        logger.info("✅ Contact message stored in database (ID: %s)", contact_id)
 
         # Send email only if EMAIL_ENABLED is true
         if EMAIL_ENABLED:
@@ -1260,9 +1605,9 @@ Mensaje:
             sg = SendGridAPIClient(sendgrid_api_key)
             response = sg.send(message)
 
-            logger.info(f"✅ Email sent successfully! Status: {response.status_code}")
+            logger.info("✅ Email sent successfully! Status: %s", response.status_code)
         else:
-            logger.info(f"📧 Email disabled, message stored in database only")
+            logger.info("📧 Email disabled, message stored in database only")
 
         return jsonify({
             'success': True,
@@ -1307,7 +1652,7 @@ def reply_form():
         
         sg = SendGridAPIClient(sendgrid_api_key)
         sg.send(message)
-        logger.info(f"Reply sent to {client_email}")
+        logger.info("Reply sent to %s", client_email)
         
         return """
         <script>
@@ -1328,41 +1673,17 @@ def reply_form():
 @app.route('/success')
 def success_page():
     """Serve the success page"""
-    try:
-        try:
-            with open('templates/success.html', 'r', encoding='utf-8') as f:
-                return f.read()
-        except FileNotFoundError:
-            with open('success.html', 'r', encoding='utf-8') as f:
-                return f.read()
-    except FileNotFoundError:
-        return "success.html not found", 404
+    return cached_page('success.html')
 
 @app.route('/error')
 def error_page():
     """Serve the error page"""
-    try:
-        try:
-            with open('templates/error.html', 'r', encoding='utf-8') as f:
-                return f.read()
-        except FileNotFoundError:
-            with open('error.html', 'r', encoding='utf-8') as f:
-                return f.read()
-    except FileNotFoundError:
-        return "error.html not found", 404
+    return cached_page('error.html')
 
 @app.route('/admin')
 def admin_page():
     """Serve the admin panel"""
-    try:
-        try:
-            with open('templates/admin.html', 'r', encoding='utf-8') as f:
-                return f.read()
-        except FileNotFoundError:
-            with open('admin.html', 'r', encoding='utf-8') as f:
-                return f.read()
-    except FileNotFoundError:
-        return "admin.html not found", 404
+    return cached_page('admin.html')
 
 #menu link
 @app.route('/la-carta')
@@ -1379,8 +1700,17 @@ def show_menu():
 def admin_calendar():
     """Get calendar data with reservation counts per day"""
     try:
-        month = int(request.args.get('month', now().month))
-        year = int(request.args.get('year', now().year))
+        try:
+            month = int(request.args.get('month', now().month))
+            year = int(request.args.get('year', now().year))
+        except ValueError:
+            return jsonify({'success': False, 'message': 'Mes o año inválido'}), 400
+        if not 1 <= month <= 12 or not 2000 <= year <= 2100:
+            return jsonify({'success': False, 'message': 'Mes o año inválido'}), 400
+        
+        cached = _CALENDAR_CACHE.get((year, month))
+        if cached is not None:
+            return jsonify(cached)
         
         # Get first and last day of month
         first_day = datetime(year, month, 1, tzinfo=TIMEZONE)
@@ -1402,63 +1732,55 @@ def admin_calendar():
         total_cells = days_before + days_in_month
         days_after = (7 - (total_cells % 7)) % 7
         
+        # Visible grid bounds as plain ISO strings so SQLite can range-seek on fecha
+        range_start = (first_day - timedelta(days=days_before)).strftime('%Y-%m-%d')
+        range_end = (last_day + timedelta(days=days_after)).strftime('%Y-%m-%d')
+        
         # Get reservation counts - separated by status
         with get_db() as conn:
             cursor = conn.cursor()
             
-            # Confirmed reservations (both user and restaurant confirmed)
-            cursor.execute('''
-                SELECT fecha, COUNT(*) as count
-                FROM reservations
-                WHERE cancelled = 0
-                AND user_confirmed = 1
-                AND restaurant_confirmed = 1
-                AND fecha >= date(?, '-' || ? || ' days')
-                AND fecha < date(?, '+' || ? || ' days')
-                GROUP BY fecha
-            ''', (first_day.strftime('%Y-%m-%d'), days_before, 
-                  last_day.strftime('%Y-%m-%d'), days_after))
-            
-            confirmed_counts = {row['fecha']: row['count'] for row in cursor.fetchall()}
-            
-            # Pending reservations (user confirmed but not restaurant)
+            # Confirmed (restaurant approved) and pending counts in one pass
             cursor.execute('''
-                SELECT fecha, COUNT(*) as count
+                SELECT fecha,
+                       SUM(CASE WHEN restaurant_confirmed = 1 THEN 1 ELSE 0 END) as confirmed,
+                       SUM(CASE WHEN restaurant_confirmed = 0 THEN 1 ELSE 0 END) as pending
                 FROM reservations
                 WHERE cancelled = 0
                 AND user_confirmed = 1
-                AND restaurant_confirmed = 0
-                AND fecha >= date(?, '-' || ? || ' days')
-                AND fecha < date(?, '+' || ? || ' days')
+                AND fecha >= ?
+                AND fecha < ?
                 GROUP BY fecha
-            ''', (first_day.strftime('%Y-%m-%d'), days_before, 
-                  last_day.strftime('%Y-%m-%d'), days_after))
+            ''', (range_start, range_end))
             
-            pending_counts = {row['fecha']: row['count'] for row in cursor.fetchall()}
-        
-        # Build calendar data
-        calendar_days = []
-        current = first_day - timedelta(days=days_before)
+            confirmed_counts = {}
+            pending_counts = {}
+            for row in cursor.fetchall():
+                confirmed_counts[row['fecha']] = row['confirmed']
+                pending_counts[row['fecha']] = row['pending']
+        
+        # Build calendar data column by column (one array per field, index = cell)
+        start = first_day.date().toordinal() - days_before
+        total = days_before + days_in_month + days_after
         today = now().date()
         
-        for i in range(days_before + days_in_month + days_after):
-            date_str = current.strftime('%Y-%m-%d')
-            calendar_days.append({
-                'date': date_str,
-                'day': current.day,
-                'confirmed_count': confirmed_counts.get(date_str, 0),
-                'pending_count': pending_counts.get(date_str, 0),
-                'otherMonth': current.month != month,
-                'isToday': current.date() == today
-            })
-            current += timedelta(days=1)
+        cells = [date.fromordinal(start + i) for i in range(total)]
+        dates = [d.isoformat() for d in cells]
         
-        return jsonify({
+        payload = {
             'success': True,
             'month': month,
             'year': year,
-            'days': calendar_days
-        })
+            'dates': dates,
+            'days': [d.day for d in cells],
+            'confirmed': [confirmed_counts.get(ds, 0) for ds in dates],
+            'pending': [pending_counts.get(ds, 0) for ds in dates],
+            'otherMonth': [d.month != month for d in cells],
+            'isToday': [d == today for d in cells]
+        }
+        _CALENDAR_CACHE[(year, month)] = payload
+        
+        return jsonify(payload)
         
     except Exception as e:
         logger.error(f"Error generating calendar: {str(e)}")
@@ -1514,19 +1836,20 @@ def admin_reservations():
             if sort not in valid_sorts:
                 sort = 'fecha'
             
+            # Columns the admin panel renders (raw dump keeps SELECT *)
             query = f'''
-                SELECT * FROM reservations
+                SELECT id, nombre, telefono, personas, fecha, hora,
+                       user_confirmed, restaurant_confirmed,
+                       cancelled, cancelled_at, cancelled_by,
+                       confirmation_token, created_at, notes
+                FROM reservations
                 WHERE {where_sql}
                 ORDER BY {sort} DESC, hora
             '''
             
             cursor.execute(query, params)
-            reservations = [dict(row) for row in cursor.fetchall()]
         
-        return jsonify({
-            'success': True,
-            'reservations': reservations
-        })
+        return stream_json_rows(cursor, 'reservations')
         
     except Exception as e:
         logger.error(f"Error fetching reservations: {str(e)}")
@@ -1542,18 +1865,13 @@ def admin_raw():
         with get_db() as conn:
             cursor = conn.cursor()
             
-            if limit == 'all':
-                query = 'SELECT * FROM reservations ORDER BY id DESC'
-            else:
-                query = f'SELECT * FROM reservations ORDER BY id DESC LIMIT {int(limit)}'
-            
-            cursor.execute(query)
-            reservations = [dict(row) for row in cursor.fetchall()]
+            # Bound parameter keeps one cached statement; LIMIT -1 means no limit
+            cursor.execute(
+                'SELECT * FROM reservations ORDER BY id DESC LIMIT ?',
+                (-1 if limit == 'all' else int(limit),)
+            )
         
-        return jsonify({
-            'success': True,
-            'reservations': reservations
-        })
+        return stream_json_rows(cursor, 'reservations')
         
     except Exception as e:
         logger.error(f"Error fetching raw data: {str(e)}")
@@ -1567,31 +1885,29 @@ def admin_cancel_reservation(reservation_id):
         data = request.json
         reason = data.get('reason', 'Cancelado desde panel admin')
         
-        with get_db() as conn:
+        with db_transaction() as conn:
             cursor = conn.cursor()
             
-            # Get reservation
-            cursor.execute('SELECT * FROM reservations WHERE id = ?', (reservation_id,))
-            reservation = cursor.fetchone()
-            
-            if not reservation:
-                return jsonify({'success': False, 'message': 'Reserva no encontrada'}), 404
-            
-            if reservation['cancelled']:
-                return jsonify({'success': False, 'message': 'Reserva ya cancelada'}), 400
-            
-            # Cancel it
+            # Cancel it, only if still active
             cursor.execute('''
                 UPDATE reservations 
                 SET cancelled = 1,
                     cancelled_at = CURRENT_TIMESTAMP,
                     cancelled_by = ?
-                WHERE id = ?
+                WHERE id = ? AND cancelled = 0
+                RETURNING nombre, telefono, fecha, hora, personas
             ''', ('admin', reservation_id))
-            conn.commit()
+            reservation = cursor.fetchone()
+            
+            if not reservation:
+                # Nothing updated: tell "missing" apart from "already cancelled"
+                cursor.execute('SELECT 1 FROM reservations WHERE id = ?', (reservation_id,))
+                if not cursor.fetchone():
+                    return jsonify({'success': False, 'message': 'Reserva no encontrada'}), 404
+                return jsonify({'success': False, 'message': 'Reserva ya cancelada'}), 400
             
             # Log action
-            log_action(reservation_id, 'cancelled', 'admin', reason)
+            log_action(reservation_id, 'cancelled', 'admin', reason, conn=conn)
             #and metric
             log_metric('reservation_cancelled',
                    id=reservation_id,
@@ -1602,15 +1918,16 @@ def admin_cancel_reservation(reservation_id):
                    reason=reason)
             # Send SMS notification
             fecha_display = format_date_spanish(reservation['fecha'])
-            message = (
-                f"Lamentamos cancelar tu reserva (sorry, reservation cancelled), {reservation['nombre']}.\n"
-                f"{fecha_display} {reservation['hora']}, {reservation['personas']} pers.\n"
-                f"Motivo: {reason}\n"
-                f"Llámanos (call us): {RESTAURANT_PHONE}"
-            )
-            send_sms(reservation['telefono'], message)
-        
-        logger.info(f"Admin cancelled reservation {reservation_id}")
+            message = SMS_ADMIN_CANCELLED.format_map({
+                **reservation,
+                'fecha_display': fecha_display,
+                'reason': reason,
+                'restaurant_phone': RESTAURANT_PHONE,
+            })
+
+        invalidate_calendar_cache()
+        send_sms_async(reservation['telefono'], message, reservation_id)
+        logger.info("Admin cancelled reservation %s", reservation_id)
         
         return jsonify({
             'success': True,
@@ -1626,32 +1943,32 @@ def admin_cancel_reservation(reservation_id):
 def admin_approve_reservation(reservation_id):
     """Approve a pending reservation (large group)"""
     try:
-        with get_db() as conn:
+        with db_transaction() as conn:
             cursor = conn.cursor()
             
-            # Get reservation
-            cursor.execute('SELECT * FROM reservations WHERE id = ?', (reservation_id,))
-            reservation = cursor.fetchone()
-            
-            if not reservation:
-                return jsonify({'success': False, 'message': 'Reserva no encontrada'}), 404
-            
-            if reservation['cancelled']:
-                return jsonify({'success': False, 'message': 'Reserva cancelada'}), 400
-            
-            if reservation['restaurant_confirmed']:
-                return jsonify({'success': False, 'message': 'Reserva ya aprobada'}), 400
-            
-            # Approve it
+            # Approve it, only if still pending
             cursor.execute('''
                 UPDATE reservations 
                 SET restaurant_confirmed = 1
-                WHERE id = ?
+                WHERE id = ? AND cancelled = 0 AND restaurant_confirmed = 0
+                RETURNING nombre, telefono, fecha, hora, personas
             ''', (reservation_id,))
-            conn.commit()
+            reservation = cursor.fetchone()
+            
+            if not reservation:
+                # Nothing updated: work out which precondition failed
+                cursor.execute(
+                    'SELECT cancelled FROM reservations WHERE id = ?', (reservation_id,)
+                )
+                row = cursor.fetchone()
+                if not row:
+                    return jsonify({'success': False, 'message': 'Reserva no encontrada'}), 404
+                if row['cancelled']:
+                    return jsonify({'success': False, 'message': 'Reserva cancelada'}), 400
+                return jsonify({'success': False, 'message': 'Reserva ya aprobada'}), 400
             
             # Log action
-            log_action(reservation_id, 'restaurant_confirmed', 'admin', 'Aprobado desde panel admin')
+            log_action(reservation_id, 'restaurant_confirmed', 'admin', 'Aprobado desde panel admin', conn=conn)
             #and metric
             log_metric('reservation_approved',
                    id=reservation_id,
@@ -1660,15 +1977,11 @@ def admin_approve_reservation(reservation_id):
                    hora=reservation['hora'])       
             # Send SMS notification
             fecha_display = format_date_spanish(reservation['fecha'])
-            message = (
-                f"{reservation['nombre']}, RESERVA APROBADA (approved by restaurant)\n"
-                f"{fecha_display} {reservation['hora']}, {reservation['personas']} pers.\n"
-                f"¡Te esperamos! See you then!\n"
-                f"Cancelar: mismo enlace (cancel: same link)"
-            )
-            send_sms(reservation['telefono'], message)
-        
-        logger.info(f"Admin approved reservation {reservation_id}")
+            message = SMS_APPROVED.format_map({**reservation, 'fecha_display': fecha_display})
+
+        invalidate_calendar_cache()
+        send_sms_async(reservation['telefono'], message, reservation_id)
+        logger.info("Admin approved reservation %s", reservation_id)
         
         return jsonify({
             'success': True,
@@ -1683,7 +1996,7 @@ def admin_approve_reservation(reservation_id):
 def admin_get_default_hours():
     """Get current default hours configuration"""
     try:
-        # Always read fresh from file
+        # Show what is saved on disk, not this worker's possibly older copy
         load_default_hours_from_file()
         
         return jsonify({
@@ -1726,7 +2039,7 @@ def admin_set_default_hours():
         # For now, it will reset on server restart (which is fine for your use case)
 
         save_default_hours_to_file()
-        logger.info(f"Default hours updated to: {DEFAULT_HOURS}")
+        logger.info("Default hours updated to: %s", DEFAULT_HOURS)
         
         return jsonify({
             'success': True,
@@ -1782,26 +2095,20 @@ def admin_get_blocked_hours(fecha):
 def admin_block_hour(fecha, hora):
     """Block a specific hour on a specific date"""
     try:
-        with get_db() as conn:
+        with db_transaction() as conn:
             cursor = conn.cursor()
             
-            # Check if already blocked
+            # Block it; UNIQUE(fecha, hora) makes this a no-op if already blocked
             cursor.execute('''
-                SELECT id FROM blocked_hours 
-                WHERE fecha = ? AND hora = ?
+                INSERT OR IGNORE INTO blocked_hours (fecha, hora)
+                VALUES (?, ?)
             ''', (fecha, hora))
             
-            if cursor.fetchone():
+            if cursor.rowcount == 0:
                 return jsonify({'success': False, 'message': 'Ya está bloqueada'}), 400
-            
-            # Block it
-            cursor.execute('''
-                INSERT INTO blocked_hours (fecha, hora)
-                VALUES (?, ?)
-            ''', (fecha, hora))
-            conn.commit()
         
-        logger.info(f"Blocked {hora} on {fecha}")
+        _BLOCKED_HOURS_CACHE.pop(fecha)
+        logger.info("Blocked %s on %s", hora, fecha)
         
         return jsonify({
             'success': True,
@@ -1817,7 +2124,7 @@ def admin_block_hour(fecha, hora):
 def admin_unblock_hour(fecha, hora):
     """Unblock a specific hour on a specific date"""
     try:
-        with get_db() as conn:
+        with db_transaction() as conn:
             cursor = conn.cursor()
             
             cursor.execute('''
@@ -1828,9 +2135,9 @@ def admin_unblock_hour(fecha, hora):
             if cursor.rowcount == 0:
                 return jsonify({'success': False, 'message': 'No estaba bloqueada'}), 400
             
-            conn.commit()
         
-        logger.info(f"Unblocked {hora} on {fecha}")
+        _BLOCKED_HOURS_CACHE.pop(fecha)
+        logger.info("Unblocked %s on %s", hora, fecha)
         
         return jsonify({
             'success': True,
@@ -1846,22 +2153,21 @@ def admin_unblock_hour(fecha, hora):
 def admin_block_all_hours(fecha):
     """Block all hours for a specific date"""
     try:
-        with get_db() as conn:
+        with db_transaction() as conn:
             cursor = conn.cursor()
             
             # Delete existing blocks for this date
             cursor.execute('DELETE FROM blocked_hours WHERE fecha = ?', (fecha,))
             
-            # Insert all default hours as blocked
-            for hora in DEFAULT_HOURS:
-                cursor.execute('''
-                    INSERT INTO blocked_hours (fecha, hora)
-                    VALUES (?, ?)
-                ''', (fecha, hora))
-            
-            conn.commit()
-        
-        logger.info(f"Blocked all hours on {fecha}")
+            # Insert all default hours as blocked, as one statement; the hours
+            # go in as a JSON array because DEFAULT_HOURS can change at runtime
+            cursor.execute('''
+                INSERT OR IGNORE INTO blocked_hours (fecha, hora)
+                SELECT ?, value FROM json_each(?)
+            ''', (fecha, json.dumps(DEFAULT_HOURS)))
+
+        _BLOCKED_HOURS_CACHE.pop(fecha)
+        logger.info("Blocked all hours on %s", fecha)
         
         return jsonify({
             'success': True,
@@ -1877,13 +2183,13 @@ def admin_block_all_hours(fecha):
 def admin_unblock_all_hours(fecha):
     """Unblock all hours for a specific date"""
     try:
-        with get_db() as conn:
+        with db_transaction() as conn:
             cursor = conn.cursor()
             
             cursor.execute('DELETE FROM blocked_hours WHERE fecha = ?', (fecha,))
-            conn.commit()
         
-        logger.info(f"Unblocked all hours on {fecha}")
+        _BLOCKED_HOURS_CACHE.pop(fecha)
+        logger.info("Unblocked all hours on %s", fecha)
         
         return jsonify({
             'success': True,
@@ -1905,6 +2211,20 @@ init_database()
 # Load default hours from file
 load_default_hours_from_file()
 
+# Read the static HTML pages into memory
+preload_static_pages()
+
+# Start the action log batch writer. atexit runs handlers last-registered
+# first; the SMS pool has already joined by then (threading shutdown), so this
+# drain runs after the manager flush below and catches everything it logged
+_action_log_thread.start()
+atexit.register(_drain_action_log)
+
+# Start the manager notification batcher
+threading.Thread(target=_manager_notification_worker, daemon=True).start()
+# The batcher is a daemon thread: send what is still pending on shutdown
+atexit.register(_flush_manager_notifications)
+
 # Log configuration with detailed info
 logger.info("=" * 70)
 logger.info("🍽️  Restaurant Reservation System Starting")
@@ -1938,8 +2258,9 @@ logger.info("=" * 70)
 
 if __name__ == '__main__':
     # Start server (only when running directly, not with gunicorn)
-    app.run(
-        host='0.0.0.0',
-        port=5000,
-        debug=False
-    )
+    if os.getenv('FLASK_ENV') == 'development':
+        app.run(host='0.0.0.0', port=5000, debug=True)
+    else:
+        logger.warning("Running Werkzeug's development server; for production use: "
+                       "gunicorn -k gthread -w $(nproc) -b 0.0.0.0:5000 app:app")
+        app.run(host='0.0.0.0', port=5000, debug=False, threaded=True)
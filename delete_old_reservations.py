@@ -24,38 +24,50 @@ def cleanup_old_reservations():
     Keeps today's reservations visible until tomorrow's cleanup
     """
     conn = sqlite3.connect(DB_PATH)
+    # Cron may fire mid-booking: wait for the web app's write to finish
+    # rather than skipping a day's cleanup on "database is locked"
+    conn.execute('PRAGMA busy_timeout=5000')
+    conn.execute('PRAGMA synchronous=NORMAL')
     cursor = conn.cursor()
     
     try:
-        # Get count before cleanup
-        cursor.execute("SELECT COUNT(*) FROM reservations WHERE date(fecha) < date('now')")
-        old_count = cursor.fetchone()[0]
-        
-        if old_count == 0:
-            logger.info("No old reservations to clean up")
-            conn.close()
-            return
+        # Listing and deletes run in one write transaction: one commit, the
+        # logged list is exactly what gets deleted, and the web app never sees
+        # reservations gone but their messages left
+        cursor.execute('BEGIN IMMEDIATE')
         
         # Log what we're deleting
+        # (there is no status column: derive it from the confirmation flags)
         cursor.execute('''
-            SELECT id, nombre, telefono, fecha, hora, status 
+            SELECT id, nombre, telefono, fecha, hora,
+                   CASE
+                       WHEN cancelled = 1 THEN 'cancelled'
+                       WHEN user_confirmed = 0 THEN 'unconfirmed'
+                       WHEN restaurant_confirmed = 0 THEN 'pending'
+                       ELSE 'confirmed'
+                   END AS status
             FROM reservations 
-            WHERE date(fecha) < date('now')
+            WHERE fecha < date('now')
         ''')
         old_reservations = cursor.fetchall()
+        old_count = len(old_reservations)
+        
+        if old_count == 0:
+            logger.info("No old reservations to clean up")
+            conn.rollback()
+            return
         
-        logger.info(f"Deleting {old_count} old reservations:")
-        for res in old_reservations:
-            logger.info(f"  ID {res[0]}: {res[1]} ({res[2]}) - {res[3]} {res[4]} [{res[5]}]")
+        # One log record for the whole list instead of one per row
+        logger.info("Deleting %d old reservations:\n%s", old_count, "\n".join(
+            "  ID %s: %s (%s) - %s %s [%s]" % tuple(res) for res in old_reservations
+        ))
         
         # Delete old reservations
         cursor.execute('''
             DELETE FROM reservations 
-            WHERE date(fecha) < date('now')
+            WHERE fecha < date('now')
         ''')
-        
-        conn.commit()
-        logger.info(f"✅ Cleaned up {old_count} old reservations")
+        deleted_reservations = cursor.rowcount
         
         # Also clean up orphaned Discord message tracking
         cursor.execute('''
@@ -64,9 +76,6 @@ def cleanup_old_reservations():
         ''')
         deleted_messages = cursor.rowcount
         
-        conn.commit()
-        logger.info(f"✅ Cleaned up {deleted_messages} orphaned Discord message records")
-        
         # Also clean up old action logs (keep last 30 days)
         cursor.execute('''
             DELETE FROM action_log 
@@ -75,6 +84,8 @@ def cleanup_old_reservations():
         deleted_logs = cursor.rowcount
         
         conn.commit()
+        logger.info(f"✅ Cleaned up {deleted_reservations} old reservations")
+        logger.info(f"✅ Cleaned up {deleted_messages} orphaned Discord message records")
         logger.info(f"✅ Cleaned up {deleted_logs} old action log entries")
         
     except Exception as e:
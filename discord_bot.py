@@ -52,6 +52,10 @@ def get_db():
     """Database connection context manager"""
     conn = sqlite3.connect(DB_PATH)
     conn.row_factory = sqlite3.Row
+    # Bot commands run while the web app is writing: wait up to 5s for
+    # its lock instead of raising "database is locked" in the handler
+    conn.execute('PRAGMA busy_timeout=5000')
+    conn.execute('PRAGMA synchronous=NORMAL')
     try:
         yield conn
     finally:
@@ -79,7 +83,10 @@ async def log_action(reservation_id, action_type, performed_by, details=None):
         ''', (reservation_id, action_type, performed_by, details))
         conn.commit()
     
-    # Send to Discord log channel
+    await post_log_embed(reservation_id, action_type, performed_by, details)
+
+async def post_log_embed(reservation_id, action_type, performed_by, details=None):
+    """Post an action to the Discord log channel"""
     if LOG_CHANNEL_ID:
         channel = bot.get_channel(LOG_CHANNEL_ID)
         if channel:
@@ -441,7 +448,7 @@ async def get_database_state(status_type):
                 WHERE user_confirmed = 1 
                 AND restaurant_confirmed = 1 
                 AND cancelled = 0
-                AND date(fecha) >= date('now')
+                AND fecha >= date('now')
                 ORDER BY fecha, hora
             '''
         elif status_type == 'pending':
@@ -458,7 +465,7 @@ async def get_database_state(status_type):
                 WHERE user_confirmed = 1 
                 AND restaurant_confirmed = 1 
                 AND cancelled = 0
-                AND date(fecha) = date('now')
+                AND fecha = date('now')
                 ORDER BY hora
             '''
         else:
@@ -548,7 +555,7 @@ async def sync_channel_with_headers(channel_id, status_type):
                 WHERE user_confirmed = 1 
                 AND restaurant_confirmed = 1 
                 AND cancelled = 0
-                AND date(fecha) >= date('now')
+                AND fecha >= date('now')
                 ORDER BY fecha, hora
             '''
         elif status_type == 'pending':
@@ -565,7 +572,7 @@ async def sync_channel_with_headers(channel_id, status_type):
                 WHERE user_confirmed = 1 
                 AND restaurant_confirmed = 1 
                 AND cancelled = 0
-                AND date(fecha) = date('now')
+                AND fecha = date('now')
                 ORDER BY hora
             '''
         else:
@@ -725,7 +732,7 @@ async def realtime_sync_task():
             
             # Get latest action log entries since last check
             cursor.execute('''
-                SELECT id, reservation_id, action_type, timestamp
+                SELECT id, reservation_id, action_type, performed_by, details, timestamp
                 FROM action_log
                 WHERE id > ?
                 ORDER BY id ASC
@@ -739,6 +746,13 @@ async def realtime_sync_task():
                 # Update last checked ID
                 last_checked_action_id = new_actions[-1]['id']
                 
+                # SMS sent in the background by the web app fail silently there:
+                # show them to staff in the log channel
+                for action in new_actions:
+                    if action['action_type'] == 'sms_failed':
+                        await post_log_embed(action['reservation_id'], action['action_type'],
+                                             action['performed_by'], action['details'])
+                
                 # Sync channels immediately
                 await sync_all_channels()
                 
@@ -811,23 +825,16 @@ async def stats(ctx):
     with get_db() as conn:
         cursor = conn.cursor()
         
-        cursor.execute('SELECT COUNT(*) FROM reservations WHERE cancelled = 0')
-        total = cursor.fetchone()[0]
-        
+        # All four counts in one pass over the table
         cursor.execute('''
-            SELECT COUNT(*) FROM reservations 
-            WHERE user_confirmed = 1 AND restaurant_confirmed = 1 AND cancelled = 0
+            SELECT
+                COALESCE(SUM(cancelled = 0), 0),
+                COALESCE(SUM(user_confirmed = 1 AND restaurant_confirmed = 1 AND cancelled = 0), 0),
+                COALESCE(SUM(user_confirmed = 1 AND restaurant_confirmed = 0 AND cancelled = 0), 0),
+                COALESCE(SUM(cancelled = 1), 0)
+            FROM reservations
         ''')
-        confirmed = cursor.fetchone()[0]
-        
-        cursor.execute('''
-            SELECT COUNT(*) FROM reservations 
-            WHERE user_confirmed = 1 AND restaurant_confirmed = 0 AND cancelled = 0
-        ''')
-        pending = cursor.fetchone()[0]
-        
-        cursor.execute('SELECT COUNT(*) FROM reservations WHERE cancelled = 1')
-        cancelled = cursor.fetchone()[0]
+        total, confirmed, pending, cancelled = cursor.fetchone()
         
         embed = discord.Embed(title="📊 Estadísticas de Reservas", color=discord.Color.blue())
         embed.add_field(name="Total Activas", value=str(total), inline=True)
@@ -0,0 +1,192 @@
+"""Test-client checks for the public and admin endpoints"""
+import json
+import os
+import tempfile
+
+os.environ['DB_PATH'] = os.path.join(tempfile.mkdtemp(), 'test.db')
+
+import pytest
+
+import app as reservas
+
+FUTURE_FECHA = '2030-01-15'
+PREVIEW_UA = 'WhatsApp/2.23.20.0 A'
+
+
+@pytest.fixture(scope='module')
+def client():
+    return reservas.app.test_client()
+
+
+def add_reservation(token, personas=2, telefono='+34611111111'):
+    """Insert an unconfirmed future reservation straight into the DB"""
+    with reservas.db_transaction() as conn:
+        conn.execute(
+            'INSERT INTO reservations (nombre, telefono, personas, fecha, hora, confirmation_token)'
+            ' VALUES (?, ?, ?, ?, ?, ?)',
+            ('Cliente', telefono, personas, FUTURE_FECHA, '21:00', token)
+        )
+
+
+def user_confirmed(token):
+    row = reservas.get_read_conn().execute(
+        'SELECT user_confirmed FROM reservations WHERE confirmation_token = ?', (token,)
+    ).fetchone()
+    return row['user_confirmed']
+
+
+# --- Confirmation links -----------------------------------------------------
+
+def test_confirm_get_does_not_confirm(client):
+    add_reservation('getonlyAAAAAAAAA')
+    r = client.get('/confirm/getonlyAAAAAAAAA')
+    assert r.status_code == 200
+    assert 'Confirma tu Reserva' in r.get_data(as_text=True)
+    assert user_confirmed('getonlyAAAAAAAAA') == 0
+
+
+def test_confirm_post_redirects_with_303(client):
+    add_reservation('postAAAAAAAAAAAA')
+    r = client.post('/confirm/postAAAAAAAAAAAA')
+    assert r.status_code == 303
+    assert r.headers['Location'].endswith('/confirm/postAAAAAAAAAAAA')
+    assert user_confirmed('postAAAAAAAAAAAA') == 1
+
+
+def test_repeated_confirm_post_skips_the_db(client):
+    add_reservation('repeatAAAAAAAAAA')
+    assert client.post('/confirm/repeatAAAAAAAAAA').status_code == 303
+    # Undo behind the app's back: a repeat inside the window must not re-run the UPDATE
+    with reservas.db_transaction() as conn:
+        conn.execute("UPDATE reservations SET user_confirmed = 0 WHERE confirmation_token = 'repeatAAAAAAAAAA'")
+    r = client.post('/confirm/repeatAAAAAAAAAA')
+    assert r.status_code == 303
+    assert user_confirmed('repeatAAAAAAAAAA') == 0
+
+
+@pytest.mark.parametrize('token', ['x' * 15, 'x' * 17, 'x' * 21, 'x' * 23, 'bad.token.AAAAAA'])
+def test_malformed_tokens_are_rejected_before_the_db(client, token):
+    r = client.get(f'/confirm/{token}')
+    assert r.status_code == 200
+    assert r.data == reservas.INVALID_TOKEN_HTML
+    # Never looked up, so never cached as dead
+    assert reservas._DEAD_TOKENS.get(token) is None
+
+
+def test_legacy_22_char_tokens_still_work(client):
+    add_reservation('legacyAAAAAAAAAAAAAAAA', telefono='+34622222222')
+    r = client.get('/confirm/legacyAAAAAAAAAAAAAAAA')
+    assert 'Confirma tu Reserva' in r.get_data(as_text=True)
+
+
+def test_dead_token_is_cached(client):
+    token = 'deadAAAAAAAAAAAA'
+    assert client.get(f'/confirm/{token}').data == reservas.INVALID_TOKEN_HTML
+    assert reservas._DEAD_TOKENS.get(token)
+    # The cached verdict is served without another lookup
+    add_reservation(token, telefono='+34633333333')
+    assert client.get(f'/confirm/{token}').data == reservas.INVALID_TOKEN_HTML
+
+
+# --- Link previews ------------------------------------------------------------
+
+def test_head_gets_preview_and_does_not_confirm(client):
+    add_reservation('headAAAAAAAAAAAA')
+    r = client.head('/confirm/headAAAAAAAAAAAA')
+    assert r.status_code == 200
+    assert user_confirmed('headAAAAAAAAAAAA') == 0
+
+
+@pytest.mark.parametrize('method', ['get', 'post'])
+def test_preview_bot_gets_og_page_and_does_not_confirm(client, method):
+    token = f'bot{method}'.ljust(16, 'A')
+    add_reservation(token)
+    r = getattr(client, method)(f'/confirm/{token}', headers={'User-Agent': PREVIEW_UA})
+    assert r.status_code == 200
+    assert r.data == reservas.LINK_PREVIEW_HTML
+    assert user_confirmed(token) == 0
+
+
+def test_preview_bot_does_not_cancel(client):
+    add_reservation('cancelbotAAAAAAA')
+    r = client.get('/cancel/cancelbotAAAAAAA', headers={'User-Agent': PREVIEW_UA})
+    assert r.data == reservas.LINK_PREVIEW_HTML
+    row = reservas.get_read_conn().execute(
+        "SELECT cancelled FROM reservations WHERE confirmation_token = 'cancelbotAAAAAAA'"
+    ).fetchone()
+    assert row['cancelled'] == 0
+
+
+# --- Input validation ---------------------------------------------------------
+
+VALID_BOOKING = {'nombre': 'Ana', 'telefono': '600 111 222', 'personas': 2,
+                 'fecha': FUTURE_FECHA, 'hora': '21:00'}
+
+
+@pytest.mark.parametrize('field, value, message', [
+    ('fecha', '20300115', 'Fecha inválida'),
+    ('fecha', '2030-02-30', 'Fecha inválida'),
+    ('hora', '25:00', 'Hora inválida'),
+    ('hora', '9:00', 'Hora inválida'),
+    ('personas', 'dos', 'Número de personas inválido'),
+    ('personas', -1, 'Número de personas inválido'),
+    ('personas', reservas.MAX_PERSONAS + 1, 'Número de personas inválido'),
+    ('nombre', 'x' * (reservas.MAX_NOMBRE_LEN + 1), 'Nombre demasiado largo'),
+    ('telefono', '6' * (reservas.MAX_TELEFONO_LEN + 1), 'Teléfono inválido'),
+    ('hora', '', 'Campo requerido: hora'),
+])
+def test_reservar_rejects_bad_fields(client, field, value, message):
+    r = client.post('/reservar', json={**VALID_BOOKING, field: value})
+    assert r.status_code == 400
+    assert r.get_json()['message'] == message
+
+
+@pytest.mark.parametrize('body', ['not json', '[1, 2]', '"text"'])
+def test_reservar_rejects_non_object_bodies(client, body):
+    r = client.post('/reservar', data=body, content_type='application/json')
+    assert r.status_code == 400
+    assert r.get_json()['message'] == 'Datos inválidos'
+
+
+@pytest.mark.parametrize('fecha, status', [
+    ('', 400), ('20301019', 400), ('2030-13-01', 400), ('2030-W42-1', 400),
+    (FUTURE_FECHA, 200),
+])
+def test_available_hours_validates_fecha(client, fecha, status):
+    r = client.get(f'/api/available-hours?fecha={fecha}')
+    assert r.status_code == status
+
+
+@pytest.mark.parametrize('query, status', [
+    ('month=0&year=2030', 400), ('month=13&year=2030', 400), ('month=abc&year=2030', 400),
+    ('month=5&year=1999', 400), ('month=5&year=2030', 200),
+])
+def test_calendar_validates_month(client, query, status):
+    r = client.get(f'/api/admin/calendar?{query}')
+    assert r.status_code == status
+
+
+# --- Admin JSON ----------------------------------------------------------------
+
+@pytest.fixture(scope='module')
+def many_rows():
+    # Enough rows to take the streamed path of stream_json_rows
+    with reservas.db_transaction() as conn:
+        conn.executemany(
+            'INSERT INTO reservations (nombre, telefono, personas, fecha, hora) VALUES (?, ?, ?, ?, ?)',
+            [(f'Cliente {i}', '+34600000000', 2, FUTURE_FECHA, '21:00')
+             for i in range(reservas.STREAM_CHUNK_ROWS * 2 + 5)]
+        )
+    return reservas.get_read_conn().execute('SELECT COUNT(*) FROM reservations').fetchone()[0]
+
+
+@pytest.mark.parametrize('url', [
+    '/api/admin/raw?limit=5', '/api/admin/raw?limit=all', '/api/admin/reservations',
+])
+def test_admin_json_parses(client, many_rows, url):
+    r = client.get(url)
+    assert r.status_code == 200
+    data = json.loads(r.get_data())
+    assert data['success'] is True
+    assert len(data['reservations']) == (5 if url.endswith('=5') else many_rows)
+    assert data['reservations'][0]['nombre'].startswith('Cliente')